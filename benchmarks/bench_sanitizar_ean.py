@@ -0,0 +1,50 @@
+"""
+Compara sanitizar_ean aplicado linha a linha com sanitizar_ean_series.
+
+    python benchmarks/bench_sanitizar_ean.py [linhas]
+"""
+import os
+import random
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from modules.ean import sanitizar_ean, sanitizar_ean_series  # noqa: E402
+
+
+def gerar_eans(n):
+    random.seed(42)
+    formatos = [
+        lambda: str(random.randint(10**12, 10**13 - 1)),
+        lambda: f" '{random.randint(10**12, 10**13 - 1)}'\n",
+        lambda: f"{random.randint(100, 999) / 100:.2f}E+12".replace(".", ","),
+        lambda: str(random.randint(10**7, 10**8 - 1)),
+        lambda: "",
+    ]
+    pesos = [80, 10, 4, 5, 1]
+    return [random.choices(formatos, pesos)[0]() for _ in range(n)]
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    serie = pd.Series(gerar_eans(n))
+
+    inicio = time.perf_counter()
+    escalar = serie.map(sanitizar_ean)
+    t_escalar = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    vetorizado = sanitizar_ean_series(serie)
+    t_vetorizado = time.perf_counter() - inicio
+
+    assert escalar.tolist() == vetorizado.tolist(), "resultados diferentes!"
+    print(f"{n} EANs")
+    print(f"  sanitizar_ean (map):   {t_escalar * 1000:8.1f} ms")
+    print(f"  sanitizar_ean_series:  {t_vetorizado * 1000:8.1f} ms")
+    print(f"  ganho: {t_escalar / t_vetorizado:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
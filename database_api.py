@@ -1,27 +1,104 @@
 import streamlit as st
 import pandas as pd
+import httpx
 from supabase import create_client, Client
+import io
 import os
-import re
-
+import time
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from modules.ean import (sanitizar_ean, sanitizar_ean_series, ean_invalido,
+                         ean_invalido_series, variantes_gtin)
+from modules.cache_produtos import cache_produtos
+from modules.indice_produtos import IndiceProdutos
+from modules.fila_contagens import FilaContagens
+from modules.offline import ArmazemOffline, sincronizar, iniciar_sincronizacao
+from modules.diretorio_usuarios import DiretorioUsuarios
+from modules.cache_relatorios import CacheRelatorios
+from modules.cache_dados import CacheDados
+from modules.erros_banco import erro_de_dados
+from modules import esquema
 
 
 # --- CONEXÃO COM SUPABASE ---
 SUPABASE_URL = st.secrets.get("SUPABASE_URL", os.getenv("SUPABASE_URL"))
 SUPABASE_KEY = st.secrets.get("SUPABASE_KEY", os.getenv("SUPABASE_KEY"))
 SUPABASE_SERVICE_KEY = st.secrets.get("SUPABASE_SERVICE_KEY", os.getenv("SUPABASE_SERVICE_KEY"))
+# Carrega o catálogo inteiro em memória para as leituras de EAN (ver get_product_info)
+PRELOAD_PRODUTOS = str(st.secrets.get("PRELOAD_PRODUTOS", os.getenv("PRELOAD_PRODUTOS", ""))).lower() in ("1", "true", "sim")
+# "Registrar" grava num diário local e o envio ao banco acontece em segundo plano
+WRITE_BEHIND_CONTAGENS = str(st.secrets.get("WRITE_BEHIND_CONTAGENS", os.getenv("WRITE_BEHIND_CONTAGENS", ""))).lower() in ("1", "true", "sim")
+# Sem conexão, consultas de EAN e contagens usam um SQLite local sincronizado depois
+OFFLINE_HABILITADO = str(st.secrets.get("OFFLINE_HABILITADO", os.getenv("OFFLINE_HABILITADO", ""))).lower() in ("1", "true", "sim")
+# Guarda também em disco (Parquet) os relatórios de estoque já processados
+CACHE_RELATORIOS_DISCO = str(st.secrets.get("CACHE_RELATORIOS_DISCO", os.getenv("CACHE_RELATORIOS_DISCO", ""))).lower() in ("1", "true", "sim")
+# Segundos que uma consulta compartilhada (cache_dados) vale sem nenhuma escrita
+# deste processo; é o atraso máximo para ver o que outras instâncias gravaram
+TTL_CACHE_DADOS = float(st.secrets.get("TTL_CACHE_DADOS", os.getenv("TTL_CACHE_DADOS", "60")))
+DIR_DADOS_LOCAIS = st.secrets.get("DIR_DADOS_LOCAIS", os.getenv(
+    "DIR_DADOS_LOCAIS", os.path.join(os.path.dirname(os.path.abspath(__file__)), "dados_locais")))
 
 supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
 supabase_admin: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
 
+# Consultas pesadas compartilhadas entre as sessões; toda função que grava
+# numa tabela chama cache_dados.invalidar(tabela)
+cache_dados = CacheDados(ttl=TTL_CACHE_DADOS)
+
+
+# --- LEITURA PAGINADA ---
+# O PostgREST corta qualquer SELECT no "max-rows" do projeto (1000 por padrão),
+# então toda leitura de tabela inteira precisa andar em janelas .range().
+TAMANHO_PAGINA = 1000
+
+
+def iterar_paginas(montar_consulta, tamanho_pagina: int = TAMANHO_PAGINA):
+    """
+    Percorre uma consulta em janelas .range() e devolve cada página (lista de dicts).
+    `montar_consulta` é uma função sem argumentos que cria a consulta já ordenada,
+    pois o builder do PostgREST não pode ser reaproveitado entre execuções.
+    """
+    inicio = 0
+    while True:
+        res = montar_consulta().range(inicio, inicio + tamanho_pagina - 1).execute()
+        pagina = res.data or []
+        if not pagina:
+            break
+        yield pagina
+        # Avança pelo que realmente veio: se o servidor tiver um limite menor
+        # que tamanho_pagina, nenhuma linha é pulada.
+        inicio += len(pagina)
+
+
+def iterar_paginas_df(montar_consulta, colunas=None, tamanho_pagina: int = TAMANHO_PAGINA):
+    """Mesmo que iterar_paginas, mas cada página já vem como DataFrame."""
+    for pagina in iterar_paginas(montar_consulta, tamanho_pagina):
+        df = pd.DataFrame(pagina)
+        if colunas:
+            for col in colunas:
+                if col not in df.columns:
+                    df[col] = ""
+            df = df[colunas]
+        yield df
+
+
+def ler_dataframe_paginado(montar_consulta, colunas=None, tamanho_pagina: int = TAMANHO_PAGINA) -> pd.DataFrame:
+    """Lê a consulta inteira, página a página, e monta um único DataFrame."""
+    partes = list(iterar_paginas_df(montar_consulta, colunas, tamanho_pagina))
+    if not partes:
+        return pd.DataFrame(columns=colunas or [])
+    return pd.concat(partes, ignore_index=True)
+
 
 # --- AUTENTICAÇÃO ---
 def sign_up(email, password, username, role="user"):
     try:
-        return supabase.auth.sign_up({
+        res = supabase.auth.sign_up({
             "email": email, "password": password,
             "options": {"data": {"username": username, "role": role}}
         })
+        diretorio_usuarios.invalidar()
+        return res
     except Exception as e:
         return e
 
@@ -61,17 +138,35 @@ def update_user_password(new_password):
         return None
 
 
+# Todas as páginas do list_users do Auth, guardadas para todas as sessões
+diretorio_usuarios = DiretorioUsuarios(
+    lambda pagina, por_pagina: supabase_admin.auth.admin.list_users(page=pagina, per_page=por_pagina)
+)
+
+
 def get_all_users():
     try:
-        return supabase_admin.auth.admin.list_users()
+        return diretorio_usuarios.usuarios()
     except Exception as e:
         st.error(f"Erro ao listar utilizadores: {e}")
         return []
 
 
+def get_user_map() -> dict:
+    """{uid: nome de usuário} de todos os usuários, para exibir nos relatórios."""
+    try:
+        return diretorio_usuarios.nomes()
+    except Exception as e:
+        st.error(f"Erro ao listar utilizadores: {e}")
+        return {}
+
+
 def delete_user_by_id(user_id):
     try:
         supabase_admin.auth.admin.delete_user(user_id)
+        diretorio_usuarios.invalidar()
+        # As contagens do usuário podem ir junto (cascade no banco)
+        cache_dados.invalidar("contagens")
         return True
     except Exception as e:
         st.error(f"Erro ao apagar utilizador: {e}")
@@ -79,26 +174,100 @@ def delete_user_by_id(user_id):
 
 
 # --- PRODUTOS ---
-def sanitizar_ean(ean_raw):
-    if ean_raw is None:
-        return None
-    ean = str(ean_raw).strip().replace("\n", "").replace(
-        "\t", "").replace("\r", "").replace("'", "").replace('"', "")
+def _buscar_produto(ean_sanitized):
+    # UPC-A pode estar gravado com 12 dígitos ou como EAN-13 com zero à esquerda:
+    # as duas formas vão na mesma consulta
+    variantes = variantes_gtin(ean_sanitized)
+    try:
+        res = supabase.table("produtos").select(
+            "*").in_("ean", variantes).execute()
+    except Exception as e:
+        if armazem_offline is None or not _sem_conexao(e):
+            raise
+        return next(filter(None, map(armazem_offline.obter_produto, variantes)), None)
+    return res.data[0] if res.data else None
+
+
+def _versao_catalogo():
+    """(total de linhas, último updated_at) do catálogo, numa única consulta."""
     try:
-        ean = ean.replace(",", ".")
-        if "e" in ean.lower():
-            ean = str(int(float(ean)))
-    except ValueError:
-        pass
-    ean = re.sub(r"\D", "", ean)
-    return ean[-13:] if ean and len(ean) > 13 else ean or None
+        res = supabase.table("produtos").select("updated_at", count="exact").order(
+            "updated_at", desc=True).limit(1).execute()
+        return res.count, res.data[0]["updated_at"] if res.data else None
+    except Exception:
+        # Banco sem a coluna updated_at (sql/001): compara só o total de linhas
+        res = supabase.table("produtos").select("ean", count="exact").limit(1).execute()
+        return res.count, None
+
+
+indice_produtos = IndiceProdutos(
+    carregar_paginas=lambda: iterar_paginas(
+        lambda: supabase.table("produtos").select(
+            "ean, descricao, emb, secao, grupo").order("ean")),
+    consultar_versao=_versao_catalogo,
+    chave=sanitizar_ean,
+)
+if PRELOAD_PRODUTOS:
+    indice_produtos.iniciar()
 
 
 def get_product_info(ean):
     ean_sanitized = sanitizar_ean(ean)
-    res = supabase.table("produtos").select(
-        "*").eq("ean", ean_sanitized).execute()
-    return res.data[0] if res.data else None
+    # Dígito verificador errado: nem vai ao banco
+    if not ean_sanitized or ean_invalido(ean_sanitized):
+        return None
+    # Com o catálogo pré-carregado a resposta sai da memória, sem rede
+    if indice_produtos.pronto:
+        return next(filter(None, map(indice_produtos.obter, variantes_gtin(ean_sanitized))), None)
+    # O cache é do processo: todas as sessões reaproveitam a mesma consulta
+    return cache_produtos.obter(ean_sanitized, _buscar_produto)
+
+
+def get_products_info(eans) -> dict:
+    """
+    Versão em lote de get_product_info: {ean sanitizado: produto ou None}.
+    O que não está no índice/cache vai ao banco numa única consulta in_()
+    (em lotes de LOTE_IN_EAN), com as variantes UPC-A/EAN-13 de cada código.
+    """
+    resultado = {}
+    faltando = []
+    for ean in eans:
+        ean_sanitized = sanitizar_ean(ean)
+        if not ean_sanitized or ean_sanitized in resultado:
+            continue
+        resultado[ean_sanitized] = None
+        if ean_invalido(ean_sanitized):
+            continue
+        if indice_produtos.pronto:
+            resultado[ean_sanitized] = next(
+                filter(None, map(indice_produtos.obter, variantes_gtin(ean_sanitized))), None)
+        else:
+            faltando.append(ean_sanitized)
+
+    # Só vai à rede o que o cache não conhece (inclusive o "não cadastrado")
+    a_buscar = [ean for ean in faltando if not cache_produtos.contem(ean)]
+    if a_buscar:
+        # Uma variante pode servir a dois pedidos (o mesmo UPC-A com 12 e 13 dígitos)
+        variantes = {}
+        for ean in a_buscar:
+            for v in variantes_gtin(ean):
+                variantes.setdefault(v, []).append(ean)
+        try:
+            linhas = _buscar_produtos_por_ean(list(variantes)).to_dict("records")
+        except Exception as e:
+            # Sem conexão: o laço abaixo cai no espelho local EAN a EAN
+            if armazem_offline is None or not _sem_conexao(e):
+                raise
+        else:
+            encontrados = {}
+            for linha in linhas:
+                for ean in variantes.get(linha["ean"], []):
+                    encontrados.setdefault(ean, linha)
+            cache_produtos.guardar({ean: encontrados.get(ean) for ean in a_buscar})
+
+    for ean in faltando:
+        resultado[ean] = cache_produtos.obter(ean, _buscar_produto)
+    return resultado
 
 
 def add_product(ean, descricao, emb=None, secao=None, grupo=None):
@@ -106,9 +275,14 @@ def add_product(ean, descricao, emb=None, secao=None, grupo=None):
     if not ean_sanitized:
         st.error("❌ EAN inválido ou ausente. Produto não inserido.")
         return
+    if ean_invalido(ean_sanitized):
+        st.error(f"❌ EAN {ean_sanitized} com dígito verificador inválido. Produto não inserido.")
+        return
+    # UPC-A gravado com 12 ou 13 dígitos é o mesmo produto (como nas leituras)
+    variantes = variantes_gtin(ean_sanitized)
     try:
         res = supabase.table("produtos").select(
-            "ean").eq("ean", ean_sanitized).execute()
+            "ean").in_("ean", variantes).execute()
         if not res.data:
             supabase.table("produtos").insert({
                 "ean": ean_sanitized,
@@ -117,22 +291,103 @@ def add_product(ean, descricao, emb=None, secao=None, grupo=None):
                 "secao": str(secao or "").strip(),
                 "grupo": str(grupo or "").strip()
             }).execute()
+            cache_produtos.invalidar(variantes)
+            cache_dados.invalidar("produtos")
+            if indice_produtos.pronto:
+                indice_produtos.aplicar([{
+                    "ean": ean_sanitized, "descricao": descricao,
+                    "emb": emb, "secao": secao, "grupo": grupo}])
             st.success(f"✅ Produto adicionado: {ean_sanitized} - {descricao}")
         else:
-            st.warning(f"🔄 Produto já existe: {ean_sanitized}")
+            st.warning(f"🔄 Produto já existe: {res.data[0]['ean']}")
     except Exception as e:
         st.error(f"❌ Erro ao adicionar produto {ean_sanitized}: {e}")
 
 
-def atualizar_produtos_via_csv(df: pd.DataFrame) -> None:
+TAMANHO_LOTE_UPSERT = 500
+MAX_LOTES_PARALELOS = 4
+TENTATIVAS_LOTE = 3
+
+
+def _com_retentativa(executar):
+    """
+    Executa `executar()` com backoff exponencial; relança o último erro.
+    Erros de dados (21000, 22xxx, 23xxx...) sobem na hora: repetir não muda nada.
+    """
+    for tentativa in range(TENTATIVAS_LOTE):
+        try:
+            return executar()
+        except Exception as e:
+            if erro_de_dados(e) or tentativa == TENTATIVAS_LOTE - 1:
+                raise
+            time.sleep(0.5 * 2 ** tentativa)
+
+
+def _upsert_com_retentativa(registros):
+    """Upsert de um lote com backoff exponencial; relança o último erro."""
+    _com_retentativa(lambda: supabase.table("produtos").upsert(
+        registros, on_conflict=["ean"]).execute())
+
+
+def _eans_existentes(eans) -> set:
+    """Quais dos EANs já estão no banco (em filtros in_() de LOTE_IN_EAN, com retentativa)."""
+    existentes = set()
+    for i in range(0, len(eans), LOTE_IN_EAN):
+        res = _com_retentativa(lambda parte=eans[i:i + LOTE_IN_EAN]: supabase.table(
+            "produtos").select("ean").in_("ean", parte).execute())
+        existentes.update(r["ean"] for r in res.data or [])
+    return existentes
+
+
+def _upsert_dividindo(registros):
+    """
+    Upsert do lote; se ele falhar mesmo com as retentativas, divide ao meio
+    até isolar as linhas problemáticas. Retorna (registros_gravados, falhas).
+    """
+    try:
+        _upsert_com_retentativa(registros)
+        return registros, []
+    except Exception as e:
+        if len(registros) == 1:
+            return [], [{"ean": registros[0]["ean"], "erro": str(e)}]
+    meio = len(registros) // 2
+    gravados_a, falhas_a = _upsert_dividindo(registros[:meio])
+    gravados_b, falhas_b = _upsert_dividindo(registros[meio:])
+    return gravados_a + gravados_b, falhas_a + falhas_b
+
+
+def _gravar_lote_produtos(registros):
+    """
+    Grava um lote: consulta antes quais EANs já existem (para separar inseridos
+    de atualizados) e só divide o lote quando o próprio upsert falha.
+    Retorna (registros_gravados, eans_que_ja_existiam, falhas).
+    """
+    try:
+        existentes = _eans_existentes([r["ean"] for r in registros])
+    except Exception as e:
+        # Falha de consulta não é culpa das linhas: dividir o lote não ajudaria
+        return [], set(), [{"ean": r["ean"], "erro": str(e)} for r in registros]
+    gravados, falhas = _upsert_dividindo(registros)
+    return gravados, existentes & {r["ean"] for r in gravados}, falhas
+
+
+def atualizar_produtos_via_csv(df: pd.DataFrame, tamanho_lote: int = TAMANHO_LOTE_UPSERT,
+                               max_paralelo: int = MAX_LOTES_PARALELOS, progresso=None) -> dict:
     """
     Insere ou atualiza produtos no banco Supabase a partir de um DataFrame.
     O DataFrame deve conter as colunas: ean, descricao, emb, secao, grupo.
+
+    O envio é feito em lotes de `tamanho_lote`, no máximo `max_paralelo` ao mesmo
+    tempo. `progresso(feitos, total)` é chamado (na thread de quem chamou) a cada
+    lote concluído. Retorna {"total", "inseridos", "atualizados", "falhas"}, onde
+    falhas é uma lista de {"ean", "erro"}. EANs repetidos contam uma vez só,
+    com os dados da última linha.
     """
+    resultado = {"total": len(df), "inseridos": 0, "atualizados": 0, "falhas": []}
     try:
         if df.empty:
             print("⚠️ Nenhum produto para atualizar.")
-            return
+            return resultado
 
         # Garante colunas necessárias
         colunas = ["ean", "descricao", "emb", "secao", "grupo"]
@@ -140,24 +395,58 @@ def atualizar_produtos_via_csv(df: pd.DataFrame) -> None:
             if col not in df.columns:
                 df[col] = ""
 
-        # Converte para lista de dicionários (payload para Supabase)
-        registros = df[colunas].to_dict(orient="records")
+        # Converte para lista de dicionários (payload para Supabase). Um EAN
+        # repetido no mesmo upsert dá erro 21000 no Postgres: fica a última linha
+        texto = esquema.como_texto(df, colunas).fillna("").drop_duplicates("ean", keep="last")
+        resultado["total"] = len(texto)
+        registros = texto.to_dict(orient="records")
+        lotes = [registros[i:i + tamanho_lote]
+                 for i in range(0, len(registros), tamanho_lote)]
 
         # UPSERT = insere novos ou atualiza se já existir (pela PK = ean)
-        supabase.table("produtos").upsert(
-            registros, on_conflict=["ean"]).execute()
-
-        print(f"✅ {len(registros)} produtos inseridos/atualizados com sucesso.")
+        gravados = []
+        feitos = 0
+        with ThreadPoolExecutor(max_workers=max_paralelo) as executor:
+            futuros = {executor.submit(_gravar_lote_produtos, lote): lote for lote in lotes}
+            for futuro in as_completed(futuros):
+                gravados_lote, existentes, falhas = futuro.result()
+                gravados.extend(gravados_lote)
+                resultado["atualizados"] += len(existentes)
+                resultado["inseridos"] += len(gravados_lote) - len(existentes)
+                resultado["falhas"].extend(falhas)
+                feitos += len(futuros[futuro])
+                if progresso:
+                    progresso(feitos, len(registros))
+
+        # O cache guarda as consultas pelas duas formas do UPC-A
+        cache_produtos.invalidar([v for r in gravados for v in variantes_gtin(r["ean"])])
+        if gravados:
+            cache_dados.invalidar("produtos")
+        if armazem_offline is not None:
+            armazem_offline.aplicar_produtos(gravados)
+        if indice_produtos.pronto:
+            indice_produtos.aplicar(gravados)
+
+        print(f"✅ {len(gravados)} produtos inseridos/atualizados com sucesso.")
+        if resultado["falhas"]:
+            print(f"❌ {len(resultado['falhas'])} produtos não puderam ser gravados.")
 
     except Exception as e:
         print(f"❌ Erro ao atualizar produtos no banco: {e}")
+        resultado["falhas"].append({"ean": None, "erro": str(e)})
+    return resultado
 
 # --- CONTAGENS ---
 
 
+def _contagens_alteradas():
+    """Chamada a cada escrita em contagens feita por este processo."""
+    cache_dados.invalidar("contagens")
+
+
 def add_or_update_count(usuario_uid, ean, quantidade: float):
     ean_sanitized = sanitizar_ean(ean)
-    if not ean_sanitized:
+    if not ean_sanitized or ean_invalido(ean_sanitized):
         st.error("EAN inválido na contagem.")
         return
     try:
@@ -170,79 +459,372 @@ def add_or_update_count(usuario_uid, ean, quantidade: float):
         return
 
     try:
-        res = supabase.table("contagens").select("id, quantidade").eq(
-            "usuario_uid", usuario_uid).eq("ean", ean_sanitized).execute()
-        if res.data:
-            registro_existente = res.data[0]
-            nova_qtd = float(registro_existente["quantidade"]) + qty_float
-            supabase.table("contagens").update({"quantidade": nova_qtd}).eq(
-                "id", registro_existente["id"]).execute()
+        if fila_contagens is not None:
+            fila_contagens.adicionar(usuario_uid, ean_sanitized, qty_float)
         else:
-            supabase.table("contagens").insert({
-                "usuario_uid": usuario_uid,
-                "ean": ean_sanitized,
-                "quantidade": qty_float
-            }).execute()
+            _incrementar_contagem(usuario_uid, ean_sanitized, qty_float)
+        _contagens_alteradas()
     except Exception as e:
+        if armazem_offline is not None and _sem_conexao(e):
+            armazem_offline.registrar_contagem(usuario_uid, ean_sanitized, qty_float)
+            st.info("📴 Sem conexão com o banco: contagem guardada no servidor do aplicativo e será sincronizada.")
+            return
         st.error(f"Erro ao registrar contagem: {e}")
 
+
+# Vira False na primeira vez que o banco responder que a função não existe
+# (sql/002 ainda não aplicado); daí em diante usamos direto o caminho antigo.
+_rpc_incremento_disponivel = True
+
+
+def _rpc_ausente(erro) -> bool:
+    """True se o erro do PostgREST indica função RPC inexistente."""
+    return getattr(erro, "code", None) in ("PGRST202", "42883")
+
+
+def _incrementar_contagem(usuario_uid, ean_sanitized, qty_float):
+    """Soma qty_float à contagem (usuario_uid, ean) numa única chamada, se possível."""
+    global _rpc_incremento_disponivel
+    if _rpc_incremento_disponivel:
+        try:
+            supabase.rpc("incrementar_contagem", {
+                "p_usuario_uid": usuario_uid,
+                "p_ean": ean_sanitized,
+                "p_quantidade": qty_float
+            }).execute()
+            return
+        except Exception as e:
+            if not _rpc_ausente(e):
+                raise
+            _rpc_incremento_disponivel = False
+
+    # Caminho antigo: SELECT + UPDATE/INSERT (sujeito a corrida entre sessões)
+    res = supabase.table("contagens").select("id, quantidade").eq(
+        "usuario_uid", usuario_uid).eq("ean", ean_sanitized).execute()
+    if res.data:
+        registro_existente = res.data[0]
+        nova_qtd = float(registro_existente["quantidade"]) + qty_float
+        supabase.table("contagens").update({"quantidade": nova_qtd}).eq(
+            "id", registro_existente["id"]).execute()
+    else:
+        supabase.table("contagens").insert({
+            "usuario_uid": usuario_uid,
+            "ean": ean_sanitized,
+            "quantidade": qty_float
+        }).execute()
+
+
+_rpc_lote_disponivel = True
+_rpc_lancamentos_disponivel = True
+
+
+def _enviar_lote_contagens(itens):
+    """
+    Grava uma lista de incrementos {usuario_uid, ean, quantidade} (com "id",
+    quando vêm da fila: reenviar o mesmo id não soma de novo, ver sql/009).
+    Retorna os itens gravados (todos, ou os que passaram antes de um erro);
+    se nenhum passar, relança o erro.
+    """
+    global _rpc_lote_disponivel, _rpc_lancamentos_disponivel
+    if not itens:
+        return []
+    if _rpc_lancamentos_disponivel:
+        try:
+            supabase.rpc("aplicar_lancamentos_contagens", {"p_itens": itens}).execute()
+            # Também chamada pela fila em segundo plano: a escrita real é aqui
+            _contagens_alteradas()
+            return itens
+        except Exception as e:
+            if not _rpc_ausente(e):
+                raise
+            _rpc_lancamentos_disponivel = False
+
+    # Sem sql/009 os reenvios não são deduplicados
+    if _rpc_lote_disponivel:
+        try:
+            supabase.rpc("incrementar_contagens_lote", {"p_itens": itens}).execute()
+            _contagens_alteradas()
+            return itens
+        except Exception as e:
+            if not _rpc_ausente(e):
+                raise
+            _rpc_lote_disponivel = False
+
+    # Sem a função de lote (sql/003): um incremento por item
+    gravados = []
+    for item in itens:
+        try:
+            _incrementar_contagem(item["usuario_uid"], item["ean"], item["quantidade"])
+        except Exception as e:
+            # Nada gravado: o erro sobe para quem chamou (a fila isola o item ruim)
+            if not gravados:
+                raise
+            print(f"Erro ao gravar contagem {item['ean']}: {e}")
+            break
+        gravados.append(item)
+    if gravados:
+        _contagens_alteradas()
+    return gravados
+
+
+fila_contagens = FilaContagens(
+    os.path.join(DIR_DADOS_LOCAIS, "fila_contagens.db"),
+    enviar_lote=_enviar_lote_contagens,
+    # Só erro nos próprios dados (FK, not null, tipo, RLS...) vai para rejeitados;
+    # rede, 5xx, timeout, JWT expirado e deadlock ficam no diário para a retentativa
+    erro_transitorio=lambda erro: not erro_de_dados(erro),
+) if WRITE_BEHIND_CONTAGENS else None
+
+
+TAMANHO_LOTE_CONTAGENS = 1000  # itens por chamada de incrementar_contagens_lote
+
+
+def add_counts_bulk(usuario_uid, itens) -> dict:
+    """
+    Registra várias contagens de uma vez: itens é uma sequência de (ean, quantidade).
+
+    Os EANs são sanitizados e validados, resolvidos no catálogo numa consulta em
+    lote e as linhas repetidas do mesmo produto somadas antes do envio, que sai
+    em lotes de TAMANHO_LOTE_CONTAGENS pelo mesmo caminho da fila (sql/003).
+    Retorna {"linhas", "registrados", "invalidos", "nao_cadastrados", "falhas"};
+    as três listas trazem os EANs como vieram na entrada.
+    """
+    df = pd.DataFrame(list(itens), columns=["entrada", "quantidade"])
+    resultado = {"linhas": len(df), "registrados": 0,
+                 "invalidos": [], "nao_cadastrados": [], "falhas": []}
+    if df.empty:
+        return resultado
+
+    df["entrada"] = df["entrada"].astype(str).str.strip()
+    df["ean"] = sanitizar_ean_series(df["entrada"])
+    df["quantidade"] = pd.to_numeric(df["quantidade"], errors="coerce")
+    invalidos = (df["ean"].isna() | ean_invalido_series(df["ean"])
+                 | df["quantidade"].isna() | (df["quantidade"] < 0))
+    resultado["invalidos"] = df.loc[invalidos, "entrada"].tolist()
+    df = df[~invalidos]
+
+    # Troca pelo EAN como está gravado (UPC-A com 12 ou 13 dígitos)
+    produtos = get_products_info(df["ean"].unique())
+    df = df.assign(ean=df["ean"].map(lambda ean: (produtos.get(ean) or {}).get("ean")))
+    resultado["nao_cadastrados"] = df.loc[df["ean"].isna(), "entrada"].tolist()
+    df = df[df["ean"].notna()]
+
+    somados = df.groupby("ean", sort=False).agg(
+        quantidade=("quantidade", "sum"), entradas=("entrada", list))
+    lote = [{"usuario_uid": usuario_uid, "ean": ean, "quantidade": float(qtd)}
+            for ean, qtd in somados["quantidade"].items()]
+
+    gravados = set()
+    try:
+        if fila_contagens is not None:
+            for item in lote:
+                fila_contagens.adicionar(usuario_uid, item["ean"], item["quantidade"])
+            gravados = set(somados.index)
+        else:
+            for i in range(0, len(lote), TAMANHO_LOTE_CONTAGENS):
+                enviados = _enviar_lote_contagens(lote[i:i + TAMANHO_LOTE_CONTAGENS])
+                gravados.update(item["ean"] for item in enviados)
+                if len(enviados) < len(lote[i:i + TAMANHO_LOTE_CONTAGENS]):
+                    break
+    except Exception as e:
+        if armazem_offline is not None and _sem_conexao(e):
+            for item in lote:
+                if item["ean"] not in gravados:
+                    armazem_offline.registrar_contagem(usuario_uid, item["ean"], item["quantidade"])
+            gravados = set(somados.index)
+            st.info("📴 Sem conexão com o banco: contagens guardadas no servidor do aplicativo e serão sincronizadas.")
+        else:
+            st.error(f"Erro ao registrar contagens: {e}")
+
+    if gravados:
+        _contagens_alteradas()
+    resultado["registrados"] = len(gravados)
+    resultado["falhas"] = [entrada for ean, entradas in somados["entradas"].items()
+                           if ean not in gravados for entrada in entradas]
+    return resultado
+
+
+# --- MODO OFFLINE ---
+def _sem_conexao(erro) -> bool:
+    """True para falhas de rede (Supabase inacessível), não para erros do banco."""
+    return isinstance(erro, (httpx.TransportError, ConnectionError, TimeoutError))
+
+
+def _enviar_lote_offline(dispositivo, itens):
+    res = supabase.rpc("sincronizar_contagens", {
+        "p_dispositivo": dispositivo, "p_itens": itens}).execute()
+    _contagens_alteradas()
+    return res.data or []
+
+
+_versao_espelho = None
+
+
+def sincronizar_offline() -> dict:
+    """
+    Envia ao Supabase as contagens feitas sem conexão e atualiza o espelho local
+    do catálogo se ele mudou. Retorna {aplicados, duplicados, conflitos}.
+    """
+    global _versao_espelho
+    resumo = sincronizar(armazem_offline, _enviar_lote_offline)
+    versao = _versao_catalogo()
+    if versao != _versao_espelho:
+        armazem_offline.espelhar_produtos(iterar_paginas(
+            lambda: supabase.table("produtos").select(
+                "ean, descricao, emb, secao, grupo").order("ean")))
+        _versao_espelho = versao
+    return resumo
+
+
+armazem_offline = ArmazemOffline(
+    os.path.join(DIR_DADOS_LOCAIS, "offline.db")) if OFFLINE_HABILITADO else None
+if armazem_offline is not None:
+    iniciar_sincronizacao(sincronizar_offline)
+
 def get_all_produtos() -> pd.DataFrame:
     """
     Busca todos os produtos no banco Supabase e retorna como DataFrame
     com as colunas: ean, descricao, emb, secao, grupo
     """
     try:
-        response = supabase.table("produtos").select(
-            "ean, descricao, emb, secao, grupo"
-        ).execute()
+        # Paginado: o catálogo passa facilmente do limite de linhas do PostgREST
+        return esquema.compactar(ler_dataframe_paginado(
+            lambda: supabase.table("produtos").select(
+                "ean, descricao, emb, secao, grupo").order("ean"),
+            colunas=["ean", "descricao", "emb", "secao", "grupo"]
+        ))
+
+    except Exception as e:
+        print(f"Erro ao buscar produtos no banco: {e}")
+        return esquema.compactar(pd.DataFrame(columns=["ean", "descricao", "emb", "secao", "grupo"]))
 
-        if not response.data:
-            return pd.DataFrame(columns=["ean", "descricao", "emb", "secao", "grupo"])
+COLUNAS_HASH = ["descricao", "emb", "secao", "grupo"]
+LOTE_IN_EAN = 200  # EANs por filtro in_() sem estourar o tamanho da URL
 
-        df = pd.DataFrame(response.data)
 
-        # Garantir que todas as colunas existam
-        for col in ["ean", "descricao", "emb", "secao", "grupo"]:
-            if col not in df.columns:
-                df[col] = ""
+def hash_conteudo_produtos(df: pd.DataFrame) -> pd.Series:
+    """
+    md5 de descricao|emb|secao|grupo de cada linha, igual à coluna gerada
+    produtos.hash_conteudo (sql/005).
+    """
+    partes = esquema.como_texto(df, COLUNAS_HASH).fillna("").astype(str)
+    texto = partes["descricao"].str.cat(partes[COLUNAS_HASH[1:]], sep="|")
+    return pd.Series(
+        [hashlib.md5(t.encode("utf-8")).hexdigest() for t in texto], index=df.index)
 
-        return df[["ean", "descricao", "emb", "secao", "grupo"]]
 
-    except Exception as e:
-        print(f"Erro ao buscar produtos no banco: {e}")
-        return pd.DataFrame(columns=["ean", "descricao", "emb", "secao", "grupo"])
+_coluna_hash_disponivel = None
+
+
+def _coluna_ausente(erro) -> bool:
+    """True se o erro do PostgREST indica coluna inexistente."""
+    return getattr(erro, "code", None) in ("42703", "PGRST204")
+
+
+def _tem_coluna_hash() -> bool:
+    global _coluna_hash_disponivel
+    if _coluna_hash_disponivel is None:
+        try:
+            supabase.table("produtos").select("hash_conteudo").limit(1).execute()
+            _coluna_hash_disponivel = True
+        except Exception as e:
+            if not _coluna_ausente(e):
+                # Rede/instabilidade: compara completo desta vez e pergunta de novo depois
+                print(f"Erro ao verificar produtos.hash_conteudo: {e}")
+                return False
+            _coluna_hash_disponivel = False
+    return _coluna_hash_disponivel
+
+
+def _buscar_produtos_por_ean(eans) -> pd.DataFrame:
+    """Linhas completas só dos EANs pedidos, em lotes de in_()."""
+    eans = list(eans)
+    partes = []
+    for i in range(0, len(eans), LOTE_IN_EAN):
+        res = supabase.table("produtos").select(
+            "ean, descricao, emb, secao, grupo").in_("ean", eans[i:i + LOTE_IN_EAN]).execute()
+        partes.append(pd.DataFrame(res.data or []))
+    colunas = ["ean", "descricao", "emb", "secao", "grupo"]
+    partes = [p for p in partes if not p.empty]
+    if not partes:
+        return pd.DataFrame(columns=colunas)
+    return pd.concat(partes, ignore_index=True)[colunas]
+
 
 def comparar_produtos_com_banco(df_csv: pd.DataFrame) -> dict:
     """
     Compara os produtos do CSV com os produtos do banco.
     Retorna um dicionário com dataframes: 'novos', 'ausentes', 'divergentes'.
+
+    Com a coluna produtos.hash_conteudo (sql/005) só baixa (ean, hash) do banco e
+    as linhas completas dos EANs ausentes ou com hash diferente; sem ela, cai
+    na comparação completa.
     """
+    if not _tem_coluna_hash():
+        return _comparar_produtos_completo(df_csv)
 
-    # 🔎 Normalização de EAN no CSV (mantém qualquer tamanho, só dígitos)
-    df_csv = df_csv.copy()
-    df_csv["ean"] = (
-        df_csv["ean"]
-        .astype(str)
-        .str.replace(r"\D", "", regex=True)
-        .str.strip()
+    colunas = ["ean", "descricao", "emb", "secao", "grupo"]
+    df_csv = esquema.como_texto(df_csv, colunas)
+    df_csv["ean"] = sanitizar_ean_series(df_csv["ean"])
+    df_csv = df_csv.drop_duplicates(subset=["ean"])
+    df_csv["hash_conteudo"] = hash_conteudo_produtos(df_csv)
+
+    df_hash = ler_dataframe_paginado(
+        lambda: supabase.table("produtos").select("ean, hash_conteudo").order("ean"),
+        colunas=["ean", "hash_conteudo"]
     )
+    # 🔎 Mesma normalização do banco que a comparação completa; o EAN como
+    # está gravado (ean_banco) é o que serve para buscar a linha depois
+    df_hash["ean_banco"] = df_hash["ean"]
+    df_hash["ean"] = sanitizar_ean_series(df_hash["ean"])
+    df_hash = df_hash.drop_duplicates(subset=["ean"])
+
+    no_banco = df_csv["ean"].isin(df_hash["ean"])
+    novos = df_csv.loc[~no_banco, colunas]
+
+    fora_do_csv = ~df_hash["ean"].isin(df_csv["ean"])
+    eans_ausentes = df_hash.loc[fora_do_csv, "ean"]
+
+    comparados = df_csv[no_banco].merge(df_hash, on="ean", suffixes=("", "_banco"))
+    alterados = comparados.loc[
+        comparados["hash_conteudo"] != comparados["hash_conteudo_banco"], colunas + ["ean_banco"]]
+
+    # Só agora buscamos as linhas completas, e apenas das que interessam
+    df_db = _buscar_produtos_por_ean(
+        pd.concat([df_hash.loc[fora_do_csv, "ean_banco"], alterados["ean_banco"]]))
+    df_db["ean"] = sanitizar_ean_series(df_db["ean"])
+    df_db = df_db.drop_duplicates(subset=["ean"])
+    ausentes = df_db[df_db["ean"].isin(eans_ausentes)]
+    divergentes = pd.merge(alterados[colunas], df_db, on="ean", how="inner",
+                           suffixes=("_arquivo", "_banco"))
+
+    return {
+        "novos": novos,
+        "ausentes": ausentes,
+        "divergentes": divergentes,
+    }
+
+
+def _comparar_produtos_completo(df_csv: pd.DataFrame) -> dict:
+    """Comparação antiga: baixa o catálogo inteiro e compara coluna a coluna."""
+
+    # Texto comum dos dois lados: categorias diferentes não se comparam
+    colunas = ["ean", "descricao", "emb", "secao", "grupo"]
+
+    # 🔎 Normalização de EAN no CSV (mesma regra de sanitizar_ean)
+    df_csv = esquema.como_texto(df_csv, colunas)
+    df_csv["ean"] = sanitizar_ean_series(df_csv["ean"])
 
     # 1. Carregar produtos do banco
     # precisa retornar um DataFrame com colunas [ean, descricao, emb, secao, grupo]
-    df_db = get_all_produtos()
+    df_db = esquema.como_texto(get_all_produtos(), colunas)
 
     # 🔎 Normalização de EAN no banco
-    df_db["ean"] = (
-        df_db["ean"]
-        .astype(str)
-        .str.replace(r"\D", "", regex=True)
-        .str.strip()
-    )
+    df_db["ean"] = sanitizar_ean_series(df_db["ean"])
 
-    # 2. Garantir colunas necessárias
-    colunas = ["ean", "descricao", "emb", "secao", "grupo"]
-    df_csv = df_csv[colunas].drop_duplicates(subset=["ean"])
-    df_db = df_db[colunas].drop_duplicates(subset=["ean"])
+    # 2. Sem EAN repetido
+    df_csv = df_csv.drop_duplicates(subset=["ean"])
+    df_db = df_db.drop_duplicates(subset=["ean"])
 
     # 3. Identificar produtos novos (presentes no CSV mas não no banco)
     novos = df_csv[~df_csv["ean"].isin(df_db["ean"])]
@@ -267,35 +849,152 @@ def comparar_produtos_com_banco(df_csv: pd.DataFrame) -> dict:
     }
 
 def get_all_contagens_detalhado():
-    return supabase.table("contagens_detalhadas").select("*").execute()
-
+    """Todas as linhas da view contagens_detalhadas (lista de dicts), lidas em páginas."""
+    linhas = []
+    # Há várias contagens por EAN: o id desempata, senão linhas empatadas podem
+    # trocar de página entre uma consulta e outra (puladas ou lidas duas vezes)
+    for pagina in iterar_paginas(
+        lambda: supabase.table("contagens_detalhadas").select("*").order("ean").order("id")
+    ):
+        linhas.extend(pagina)
+    return linhas
+
+
+
+def _ler_relatorio_contagens_completo():
+    linhas = []
+    for pagina in iterar_paginas(
+        lambda: supabase_admin.table("contagens").select(
+            "id, ean, quantidade, last_updated_at, usuario_uid, produtos(descricao, emb, secao, grupo)"
+        ).order("id")
+    ):
+        linhas.extend(pagina)
+    return linhas
 
 
 def get_relatorio_contagens_completo():
+    """Todas as contagens com os dados do produto (lista compartilhada: não alterar)."""
     try:
-        res = supabase_admin.table("contagens").select(
-            "id, ean, quantidade, last_updated_at, usuario_uid, produtos(descricao, emb, secao, grupo)"
-        ).execute()
-        return res.data
+        return cache_dados.obter("relatorio_contagens", ("contagens", "produtos"),
+                                 _ler_relatorio_contagens_completo)
     except Exception as e:
         st.error(f"Erro ao gerar relatório: {e}")
         return []
 
 
+TAMANHO_PAGINA_RELATORIO = 200
+COLUNAS_RELATORIO = ["id", "ean", "quantidade", "last_updated_at", "usuario_uid",
+                     "descricao", "emb", "secao", "grupo"]
+
+
+def get_relatorio_contagens_pagina(pagina: int = 0, por_pagina: int = TAMANHO_PAGINA_RELATORIO,
+                                   usuario_uid=None, secao=None, grupo=None):
+    """
+    Uma janela do relatório de contagens com os filtros aplicados no banco.
+    Retorna (DataFrame com COLUNAS_RELATORIO, total de linhas que casam com os filtros).
+    Filtrar por seção/grupo exige o join produtos!inner; sem esses filtros o join
+    continua opcional, como no relatório completo.
+    """
+    def ler():
+        produtos = "produtos!inner" if (secao or grupo) else "produtos"
+        consulta = supabase_admin.table("contagens").select(
+            f"id, ean, quantidade, last_updated_at, usuario_uid, {produtos}(descricao, emb, secao, grupo)",
+            count="exact")
+        if usuario_uid:
+            consulta = consulta.eq("usuario_uid", usuario_uid)
+        if secao:
+            consulta = consulta.eq("produtos.secao", secao)
+        if grupo:
+            consulta = consulta.eq("produtos.grupo", grupo)
+        inicio = pagina * por_pagina
+        res = consulta.order("id").range(inicio, inicio + por_pagina - 1).execute()
+        linhas = [{**{k: v for k, v in linha.items() if k != "produtos"}, **(linha.get("produtos") or {})}
+                  for linha in res.data or []]
+        return pd.DataFrame(linhas, columns=COLUNAS_RELATORIO), res.count or 0
+
+    try:
+        return cache_dados.obter(
+            ("relatorio_pagina", pagina, por_pagina, usuario_uid, secao, grupo),
+            ("contagens", "produtos"), ler)
+    except Exception as e:
+        st.error(f"Erro ao gerar relatório: {e}")
+        return pd.DataFrame(columns=COLUNAS_RELATORIO), 0
+
+
+def get_usuarios_com_contagem():
+    """UIDs que têm alguma contagem (view do sql/006); None se a view não existir."""
+    def ler():
+        res = supabase_admin.table("distinct_usuarios_contagem").select("usuario_uid").execute()
+        return [item["usuario_uid"] for item in res.data or []]
+
+    try:
+        return cache_dados.obter("usuarios_com_contagem", ("contagens",), ler)
+    except Exception:
+        return None
+
+
 def update_count(count_id: int, new_quantity: float, admin: bool = False) -> bool:
     try:
         client = supabase_admin if admin else supabase
         client.table("contagens").update(
             {"quantidade": float(new_quantity)}
         ).eq("id", count_id).execute()
+        _contagens_alteradas()
         return True
     except Exception as e:
         st.error(f"Erro ao atualizar contagem: {e}")
         return False
 
+_rpc_edicao_lote_disponivel = True
+
+
+def update_counts_bulk(alteracoes: dict) -> dict:
+    """
+    Aplica várias edições de quantidade {id: nova quantidade} de uma vez.
+    Com sql/007 vai tudo numa única chamada RPC (uma transação só); sem a
+    função, cai em update_count por linha, em paralelo.
+    Retorna {"atualizados": quantidade, "falhas": [ids não gravados]}.
+    """
+    global _rpc_edicao_lote_disponivel
+    itens = [{"id": int(count_id), "quantidade": float(qtd)} for count_id, qtd in alteracoes.items()]
+    if not itens:
+        return {"atualizados": 0, "falhas": []}
+
+    if _rpc_edicao_lote_disponivel:
+        try:
+            supabase_admin.rpc("atualizar_contagens_lote", {"p_itens": itens}).execute()
+            _contagens_alteradas()
+            return {"atualizados": len(itens), "falhas": []}
+        except Exception as e:
+            if not _rpc_ausente(e):
+                st.error(f"Erro ao atualizar contagens: {e}")
+                return {"atualizados": 0, "falhas": [item["id"] for item in itens]}
+            _rpc_edicao_lote_disponivel = False
+
+    def atualizar(item):
+        supabase_admin.table("contagens").update(
+            {"quantidade": item["quantidade"]}).eq("id", item["id"]).execute()
+
+    falhas = []
+    with ThreadPoolExecutor(max_workers=MAX_LOTES_PARALELOS) as executor:
+        futuros = {executor.submit(atualizar, item): item["id"] for item in itens}
+        for futuro in as_completed(futuros):
+            try:
+                futuro.result()
+            except Exception as e:
+                print(f"Erro ao atualizar contagem {futuros[futuro]}: {e}")
+                falhas.append(futuros[futuro])
+    if len(falhas) < len(itens):
+        _contagens_alteradas()
+    if falhas:
+        st.error(f"Erro ao atualizar {len(falhas)} contagem(ns).")
+    return {"atualizados": len(itens) - len(falhas), "falhas": falhas}
+
+
 def delete_count_by_id(count_id: int):
     try:
         supabase.table("contagens").delete().eq("id", count_id).execute()
+        _contagens_alteradas()
         return True
     except Exception as e:
         st.error(f"Erro ao deletar contagem: {e}")
@@ -306,6 +1005,7 @@ def delete_all_counts_by_user(user_uid: str):
     try:
         supabase_admin.table("contagens").delete().eq(
             "usuario_uid", user_uid).execute()
+        _contagens_alteradas()
         return True
     except Exception as e:
         st.error(f"Erro ao deletar contagens do usuário: {e}")
@@ -315,41 +1015,51 @@ def delete_all_counts_by_user(user_uid: str):
 def delete_all_counts():
     try:
         supabase_admin.table("contagens").delete().neq("id", 0).execute()
+        _contagens_alteradas()
         return True
     except Exception as e:
         st.error(f"Erro ao deletar todas as contagens: {e}")
         return False
 
 
+LOTE_IN_IDS = 300  # ids por filtro in_() no DELETE, para a URL não passar do limite
+
+
 def delete_contagens_by_ids(ids_list):
+    """Apaga as contagens pelos ids, em lotes. Retorna quantas foram apagadas."""
+    ids_list = list(ids_list)
+    apagados = 0
     try:
-        supabase_admin.table("contagens").delete().in_(
-            "id", ids_list).execute()
-        return True
+        for i in range(0, len(ids_list), LOTE_IN_IDS):
+            res = supabase_admin.table("contagens").delete().in_(
+                "id", ids_list[i:i + LOTE_IN_IDS]).execute()
+            apagados += len(res.data or [])
     except Exception as e:
-        st.error(f"Erro ao apagar registros: {e}")
-        return False
+        st.error(f"Erro ao apagar registros ({apagados} de {len(ids_list)} apagados): {e}")
+    finally:
+        # Os lotes que passaram já mudaram a tabela, mesmo com erro num seguinte
+        _contagens_alteradas()
+    return apagados
 
 
 # --- CONSULTAS AUXILIARES ---
 def produto_existe(ean):
-    ean_sanitized = sanitizar_ean(ean)
-    if not ean_sanitized:
-        return False
-    res = supabase.table("produtos").select(
-        "ean").eq("ean", ean_sanitized).execute()
-    return bool(res.data)
+    return get_product_info(ean) is not None
 
 
 def get_all_products_df():
-    response = supabase.table("produtos").select("*").execute()
-    return pd.DataFrame(response.data or [])
+    return ler_dataframe_paginado(
+        lambda: supabase.table("produtos").select("*").order("ean"))
+
+
+def _valores_distintos(view, coluna):
+    res = supabase.table(view).select(coluna).execute()
+    return [item[coluna] for item in res.data] if res.data else []
 
 
 def get_all_secoes():
     try:
-        res = supabase.table("distinct_secoes").select("secao").execute()
-        return [item["secao"] for item in res.data] if res.data else []
+        return cache_dados.obter("secoes", ("produtos",), lambda: _valores_distintos("distinct_secoes", "secao"))
     except Exception as e:
         st.error(f"Erro ao buscar seções: {e}")
         return []
@@ -357,8 +1067,7 @@ def get_all_secoes():
 
 def get_all_grupos():
     try:
-        res = supabase.table("distinct_grupos").select("grupo").execute()
-        return [item["grupo"] for item in res.data] if res.data else []
+        return cache_dados.obter("grupos", ("produtos",), lambda: _valores_distintos("distinct_grupos", "grupo"))
     except Exception as e:
         st.error(f"Erro ao buscar grupos: {e}")
         return []
@@ -366,8 +1075,7 @@ def get_all_grupos():
 
 def get_all_embs():
     try:
-        res = supabase.table("distinct_embs").select("emb").execute()
-        return [item["emb"] for item in res.data] if res.data else []
+        return cache_dados.obter("embs", ("produtos",), lambda: _valores_distintos("distinct_embs", "emb"))
     except Exception as e:
         st.error(f"Erro ao buscar embalagens: {e}")
         return []
@@ -380,43 +1088,49 @@ def get_contagens_por_usuario(user_uid: str):
     try:
         # Usamos o cliente admin para garantir que a consulta funcione
         # mesmo que as regras de segurança (RLS) fossem mais restritivas.
-        res = supabase_admin.table("contagens").select(
-            "quantidade, produtos(ean, descricao, emb, secao, grupo)"
-        ).eq("usuario_uid", user_uid).execute()
-
-        return res.data
+        linhas = []
+        for pagina in iterar_paginas(
+            lambda: supabase_admin.table("contagens").select(
+                "quantidade, produtos(ean, descricao, emb, secao, grupo)"
+            ).eq("usuario_uid", user_uid).order("id")
+        ):
+            linhas.extend(pagina)
+        return linhas
     except Exception as e:
         st.error(f"Erro ao buscar contagens do usuário: {e}")
         return []
 
 
-def carregar_relatorio_sistema(arquivo):
+def _processar_relatorio_sistema(conteudo: bytes) -> pd.DataFrame:
     """Lê e normaliza o CSV do sistema; valida colunas e consolida possíveis duplicidades no sistema."""
     colunas_necessarias = ['Código', 'Descrição', 'Estoque', 'Quebra 2']
-    df = pd.read_csv(arquivo, sep=';', encoding='latin1', decimal=',')
+    # Código como texto: lido como número, o EAN viraria "7891234567890.0"
+    df = pd.read_csv(io.BytesIO(conteudo), sep=';', encoding='latin1', decimal=',',
+                     dtype={'Código': str, 'Quebra 2': str},
+                     usecols=lambda coluna: coluna in colunas_necessarias)
     faltando = [c for c in colunas_necessarias if c not in df.columns]
     if faltando:
         raise KeyError(f"Colunas ausentes no relatório: {faltando}")
 
     coluna_de_dados = df['Quebra 2'].astype(str)
-    df['secao'] = coluna_de_dados.str.extract(
+    secao = coluna_de_dados.str.extract(
         r'Seç[ãa]o:\s*\d+\s*-\s*(.*?)(?:Grupo:|$)', expand=False
     ).str.strip()
-    df['grupo'] = coluna_de_dados.str.extract(
+    grupo = coluna_de_dados.str.extract(
         r'Grupo:\s*\d+\s*-\s*(.*)', expand=False
     ).str.strip()
 
-    df['grupo'].fillna('', inplace=True)
-    df['secao'].fillna(method='ffill', inplace=True)
-    df['grupo'].fillna(method='ffill', inplace=True)
-    df.dropna(subset=['Código'], inplace=True)
-
-    df.rename(columns={
-        'Código': 'ean',
-        'Descrição': 'descricao',
-        'Estoque': 'estoque_sistema'
-    }, inplace=True)
-    df['ean'] = df['ean'].astype(str)
+    # A seção só aparece em algumas linhas e vale para as seguintes
+    with pd.option_context("future.no_silent_downcasting", True):
+        secao = secao.ffill()
+    df = pd.DataFrame({
+        'ean': df['Código'],
+        'descricao': df['Descrição'],
+        'secao': secao,
+        'grupo': grupo.fillna(''),
+        'estoque_sistema': df['Estoque'],
+    }).dropna(subset=['ean'])
+    df['ean'] = sanitizar_ean_series(df['ean'])
 
     # Se o sistema tiver mesmas linhas repetidas para um EAN, consolidamos somando o estoque.
     df_sistema = df.groupby('ean', as_index=False).agg({
@@ -426,24 +1140,102 @@ def carregar_relatorio_sistema(arquivo):
         'estoque_sistema': 'sum'
     })
 
-    return df_sistema
+    # Fica no cache do processo: tipos compactos (ver modules/esquema.py)
+    return esquema.compactar(df_sistema)
+
+
+# Relatórios já processados, pelo hash do conteúdo (e em Parquet, se habilitado)
+cache_relatorios = CacheRelatorios(
+    diretorio=os.path.join(DIR_DADOS_LOCAIS, "relatorios") if CACHE_RELATORIOS_DISCO else None)
+
+
+def carregar_relatorio_sistema(arquivo):
+    """
+    Relatório de estoque do sistema normalizado (ean, descricao, secao, grupo,
+    estoque_sistema). O mesmo arquivo não é processado duas vezes: o resultado
+    fica no cache do processo (somente leitura; copie antes de alterar).
+    """
+    conteudo = arquivo if isinstance(arquivo, bytes) else arquivo.getvalue()
+    return cache_relatorios.obter(conteudo, _processar_relatorio_sistema)
+
+
+# Vira False se a tabela contagens_consolidadas (sql/008) não existir
+_consolidado_disponivel = True
+
+
+def _tabela_ausente(erro) -> bool:
+    """True se o erro do PostgREST indica tabela/view inexistente."""
+    return getattr(erro, "code", None) in ("PGRST205", "42P01")
+
+
+def get_contagens_consolidadas():
+    """
+    Total contado por EAN lido da tabela contagens_consolidadas (sql/008),
+    uma linha por produto. Retorna DataFrame (ean, estoque_contado, linhas),
+    ou None se a tabela ainda não existir no banco.
+    """
+    global _consolidado_disponivel
+    if not _consolidado_disponivel:
+        return None
+    try:
+        df = ler_dataframe_paginado(
+            lambda: supabase.table("contagens_consolidadas").select(
+                "ean, quantidade, linhas").order("ean"),
+            colunas=["ean", "quantidade", "linhas"])
+    except Exception as e:
+        if not _tabela_ausente(e):
+            raise
+        _consolidado_disponivel = False
+        return None
+    return df.rename(columns={"quantidade": "estoque_contado"})
+
+
+def versao_contagens():
+    """
+    Marcador que muda quando as contagens mudam: escritas deste processo +
+    (linhas, último carimbo de data) lidos do banco numa consulta só, o que
+    também pega o que outras instâncias e a fila em segundo plano gravaram.
+    """
+    if _consolidado_disponivel:
+        tabela, coluna = "contagens_consolidadas", "atualizado_em"
+    else:
+        tabela, coluna = "contagens", "last_updated_at"
+    try:
+        res = supabase.table(tabela).select(coluna, count="exact").order(
+            coluna, desc=True).limit(1).execute()
+        return cache_dados.versao("contagens"), res.count, res.data[0][coluna] if res.data else None
+    except Exception as e:
+        # Sem o marcador do banco nenhuma versão se repete: nada de cache velho
+        print(f"Erro ao consultar versão das contagens: {e}")
+        return cache_dados.versao("contagens"), time.time()
 
 
 def carregar_contagens_consolidadas():
     """Lê as contagens do banco e consolida somando por EAN.
        Retorna (df_consolidado, n_linhas_originais, n_eans_unicos).
+       O resultado é compartilhado entre as sessões enquanto versao_contagens()
+       não mudar.
     """
-    contagens_resultado = get_all_contagens_detalhado()
-    df = pd.DataFrame(contagens_resultado.data)
+    return cache_dados.obter("contagens_consolidadas", ("contagens",),
+                             _consolidar_contagens, marcador=versao_contagens())
+
+
+def _consolidar_contagens():
+    consolidado = get_contagens_consolidadas()
+    if consolidado is not None:
+        n_linhas = int(pd.to_numeric(consolidado["linhas"]).sum())
+        return esquema.compactar(consolidado.drop(columns="linhas")), n_linhas, len(consolidado)
+
+    # Banco sem sql/008: soma todas as linhas aqui
+    df = pd.DataFrame(get_all_contagens_detalhado())
 
     if df.empty:
-        return pd.DataFrame(columns=['ean', 'estoque_contado']), 0, 0
+        return esquema.compactar(pd.DataFrame(columns=['ean', 'estoque_contado'])), 0, 0
 
     df.rename(columns={'quantidade': 'estoque_contado'}, inplace=True)
     # Mantemos só ean e quantidade (caso tenha mais colunas, ignoramos aqui)
-    df = df[['ean', 'estoque_contado']].copy()
     n_linhas = len(df)
     df_group = df.groupby('ean', as_index=False)['estoque_contado'].sum()
     n_unicos = len(df_group)
 
-    return df_group, n_linhas, n_unicos
+    return esquema.compactar(df_group), n_linhas, n_unicos
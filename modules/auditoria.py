@@ -0,0 +1,171 @@
+import hashlib
+import threading
+import numpy as np
+import pandas as pd
+from cachetools import LRUCache
+from modules.esquema import quantidade_exata
+
+COLUNAS_AUDITORIA = ['ean', 'descricao', 'secao', 'grupo',
+                     'estoque_sistema', 'estoque_contado', 'diferenca']
+COLUNAS_NUMERICAS = ['estoque_sistema', 'estoque_contado', 'diferenca']
+
+TIPOS_DIFERENCA = ["Mostrar Todos", "Apenas com Diferença",
+                   "Diferença Positiva", "Diferença Negativa", "Sem Diferença (Zerados)"]
+
+
+def formatar_numeros(serie: pd.Series) -> pd.Series:
+    """
+    Formatação de exibição de uma coluna inteira: inteiros sem casas decimais,
+    demais com vírgula, vazio para NaN (mesma regra do antigo formatar_numero).
+    """
+    valores = pd.to_numeric(serie, errors="coerce").to_numpy(dtype=float)
+    vazios = np.isnan(valores)
+    valores_ok = np.where(vazios, 0.0, valores)
+    inteiros = np.isclose(valores_ok, np.trunc(valores_ok), rtol=1e-9, atol=0.0)
+    texto = np.where(
+        inteiros,
+        np.round(valores_ok).astype(np.int64).astype(str),
+        np.char.replace(valores_ok.astype(str), ".", ","),
+    )
+    texto[vazios] = ""
+    return pd.Series(texto, index=serie.index, dtype=object)
+
+
+def _opcoes(valores) -> list:
+    return sorted(v for v in valores if pd.notna(v) and str(v).strip() != '')
+
+
+class Auditoria:
+    """
+    Quadro de auditoria (sistema x contado) calculado uma vez e filtrado por
+    fatias de índice: o merge, as métricas, a ordenação por descrição e a
+    formatação de exibição acontecem na construção, não a cada clique.
+    """
+
+    def __init__(self, df_sistema: pd.DataFrame, df_contado: pd.DataFrame,
+                 n_linhas_contagens: int = 0, n_unicos_contagens: int = 0):
+        # Merge (sistema é a base)
+        df = pd.merge(df_sistema, df_contado, on='ean', how='left')
+        df['estoque_contado'] = quantidade_exata(df['estoque_contado']).fillna(0)
+        df['estoque_sistema'] = quantidade_exata(df['estoque_sistema']).fillna(0)
+        df['diferenca'] = df['estoque_contado'] - df['estoque_sistema']
+
+        # Ordem A → Z pela descrição (sem diferenciar maiúsculas), uma vez só:
+        # toda fatia por posição crescente já sai ordenada
+        df = df[COLUNAS_AUDITORIA].sort_values(
+            by='descricao', key=lambda s: s.astype(str).str.lower(), kind='stable'
+        ).reset_index(drop=True)
+        self.df = df
+        self.n_linhas_contagens = n_linhas_contagens
+        self.n_unicos_contagens = n_unicos_contagens
+
+        diferenca = df['diferenca'].to_numpy()
+        contado = df['estoque_contado'].to_numpy()
+        self.resumo = {
+            "total_produtos": len(df),
+            "produtos_contados": int((contado > 0).sum()),
+            "produtos_com_diferenca": int((diferenca != 0).sum()),
+            "diferencas_positivas": int((diferenca > 0).sum()),
+            "diferencas_negativas": int((diferenca < 0).sum()),
+            "soma_diferencas": float(diferenca.sum()),
+        }
+
+        # Posições (já em ordem de descrição) por seção e por (seção, grupo);
+        # observed=True: com seção/grupo categóricos, só as combinações que existem
+        self._por_secao = df.groupby('secao', sort=False, observed=True).indices
+        self._por_secao_grupo = df.groupby(['secao', 'grupo'], sort=False, observed=True).indices
+        self._por_grupo = df.groupby('grupo', sort=False, observed=True).indices
+        self._mascaras = {
+            "Mostrar Todos": None,
+            "Apenas com Diferença": diferenca != 0,
+            "Diferença Positiva": diferenca > 0,
+            "Diferença Negativa": diferenca < 0,
+            "Sem Diferença (Zerados)": diferenca == 0,
+        }
+        self._contados = contado != 0
+        self._secoes = _opcoes(self._por_secao)
+        self._grupos = _opcoes(self._por_grupo)
+        self._grupos_da_secao = {}
+        for secao, grupo in self._por_secao_grupo:
+            self._grupos_da_secao.setdefault(secao, []).append(grupo)
+
+        # Colunas numéricas já formatadas para exibição; as de texto são as
+        # mesmas de self.df (sem cópia)
+        self.df_formatado = pd.DataFrame(
+            {col: formatar_numeros(df[col]) if col in COLUNAS_NUMERICAS else df[col]
+             for col in COLUNAS_AUDITORIA},
+            copy=False,
+        )
+
+    def __len__(self):
+        return len(self.df)
+
+    def secoes(self) -> list:
+        return self._secoes
+
+    def grupos(self, secao=None) -> list:
+        """Grupos disponíveis dentro da seção escolhida (ou todos)."""
+        if secao is None:
+            return self._grupos
+        return _opcoes(self._grupos_da_secao.get(secao, []))
+
+    def filtrar(self, secao=None, grupo=None, tipo_diferenca="Mostrar Todos",
+                apenas_contados=False) -> np.ndarray:
+        """Posições das linhas que passam nos filtros, em ordem de descrição."""
+        if secao is not None and grupo is not None:
+            posicoes = self._por_secao_grupo.get((secao, grupo), np.array([], dtype=np.intp))
+        elif secao is not None:
+            posicoes = self._por_secao.get(secao, np.array([], dtype=np.intp))
+        elif grupo is not None:
+            posicoes = self._por_grupo.get(grupo, np.array([], dtype=np.intp))
+        else:
+            posicoes = np.arange(len(self.df))
+
+        mascara = self._mascaras[tipo_diferenca]
+        if mascara is not None:
+            posicoes = posicoes[mascara[posicoes]]
+        if apenas_contados:
+            posicoes = posicoes[self._contados[posicoes]]
+        return posicoes
+
+    def dados(self, posicoes) -> pd.DataFrame:
+        """Fatia com os valores numéricos (para o download)."""
+        return self.df.iloc[posicoes].reset_index(drop=True)
+
+    def exibicao(self, posicoes) -> pd.DataFrame:
+        """Fatia com os números já formatados (para a tabela na tela)."""
+        return self.df_formatado.iloc[posicoes].reset_index(drop=True)
+
+
+# --- Cache do processo ---
+# Uma auditoria por (conteúdo do relatório, versão das contagens); a troca de
+# filtro reaproveita o objeto, e uma contagem nova gera outra versão.
+_cache = LRUCache(maxsize=8)
+_lock = threading.Lock()
+
+
+def chave_arquivo(conteudo: bytes) -> str:
+    return hashlib.blake2b(conteudo, digest_size=16).hexdigest()
+
+
+def obter_auditoria(conteudo: bytes, versao_contagens, carregar_sistema, carregar_contado) -> Auditoria:
+    """
+    Devolve a auditoria do relatório `conteudo` para a versão atual das contagens.
+    - carregar_sistema(): DataFrame do relatório do sistema
+    - carregar_contado(): (df_consolidado, n_linhas, n_unicos), como
+      database_api.carregar_contagens_consolidadas
+    """
+    chave = (chave_arquivo(conteudo), versao_contagens)
+    with _lock:
+        auditoria = _cache.get(chave)
+    if auditoria is None:
+        df_contado, n_linhas, n_unicos = carregar_contado()
+        auditoria = Auditoria(carregar_sistema(), df_contado, n_linhas, n_unicos)
+        with _lock:
+            _cache[chave] = auditoria
+    return auditoria
+
+
+def limpar_cache():
+    with _lock:
+        _cache.clear()
@@ -0,0 +1,79 @@
+import threading
+from cachetools import TTLCache
+
+
+class CacheDados:
+    """
+    Resultados de consultas ao banco compartilhados por todas as sessões do
+    processo, com invalidação por versão de tabela.
+
+    Cada resultado é guardado junto com as versões das tabelas de que depende
+    (e de um marcador opcional); qualquer escrita numa delas chama invalidar()
+    e a próxima leitura vai ao banco de novo. O `ttl` limita o quanto se
+    enxerga atrasado o que outros processos gravaram.
+
+    Os valores devolvidos são compartilhados: quem precisar alterar deve copiar.
+    """
+
+    def __init__(self, maxsize: int = 128, ttl: float = 60):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._versoes = {}
+        self._lock = threading.Lock()
+        # Uma trava por chave sendo carregada: sessões que pedem a mesma
+        # consulta ao mesmo tempo esperam e usam o resultado da primeira
+        self._carregando = {}
+
+    def versao(self, tabela: str) -> int:
+        """Quantas vezes a tabela foi alterada por este processo."""
+        with self._lock:
+            return self._versoes.get(tabela, 0)
+
+    def invalidar(self, *tabelas):
+        """Marca as tabelas como alteradas e descarta o que dependia delas."""
+        with self._lock:
+            for tabela in tabelas:
+                self._versoes[tabela] = self._versoes.get(tabela, 0) + 1
+            for chave, (dependencias, _, _) in list(self._cache.items()):
+                if any(tabela in dependencias for tabela in tabelas):
+                    del self._cache[chave]
+
+    def _valido(self, chave, tabelas, marcador):
+        """(True, valor) se o guardado ainda vale; chamar com self._lock."""
+        versoes = tuple(self._versoes.get(tabela, 0) for tabela in tabelas)
+        item = self._cache.get(chave)
+        if item is not None and item[1] == (versoes, marcador):
+            return True, item[2], versoes
+        return False, None, versoes
+
+    def obter(self, chave, tabelas, carregar, marcador=None):
+        """
+        Resultado de `carregar()` para `chave`, reaproveitado enquanto nenhuma
+        das `tabelas` mudar e o `marcador` (ex.: versão lida do banco) for o mesmo.
+        Exceções de `carregar` sobem sem nada ser guardado.
+        """
+        tabelas = tuple(tabelas)
+        with self._lock:
+            valido, valor, _ = self._valido(chave, tabelas, marcador)
+            if valido:
+                return valor
+            trava = self._carregando.setdefault(chave, threading.Lock())
+
+        with trava:
+            with self._lock:
+                valido, valor, versoes = self._valido(chave, tabelas, marcador)
+            if valido:
+                return valor
+            # As versões são lidas antes da consulta: uma escrita durante o
+            # carregamento deixa o resultado já vencido na próxima leitura
+            try:
+                valor = carregar()
+                with self._lock:
+                    self._cache[chave] = (tabelas, (versoes, marcador), valor)
+            finally:
+                with self._lock:
+                    self._carregando.pop(chave, None)
+            return valor
+
+    def limpar(self):
+        with self._lock:
+            self._cache.clear()
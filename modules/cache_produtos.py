@@ -0,0 +1,56 @@
+import threading
+from cachetools import TTLCache
+
+# Valor guardado para EANs que não existem no banco (cache negativo).
+# Não usamos None porque None é o retorno de "não está no cache".
+_NAO_CADASTRADO = object()
+
+
+class CacheProdutos:
+    """
+    Cache em memória do catálogo, compartilhado por todas as sessões do processo.
+    Guarda o registro de cada EAN consultado (ou a ausência dele) com LRU + TTL.
+    """
+
+    def __init__(self, maxsize: int = 50_000, ttl: float = 300):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        # TTLCache não é thread-safe e o Streamlit atende cada sessão numa thread
+        self._lock = threading.Lock()
+
+    def obter(self, ean, carregar):
+        """
+        Devolve o produto do EAN a partir do cache; em caso de falta chama
+        `carregar(ean)` (que deve retornar dict ou None) e guarda o resultado.
+        """
+        with self._lock:
+            valor = self._cache.get(ean)
+        if valor is None:
+            produto = carregar(ean)
+            with self._lock:
+                self._cache[ean] = produto if produto is not None else _NAO_CADASTRADO
+            return produto
+        return None if valor is _NAO_CADASTRADO else valor
+
+    def contem(self, ean) -> bool:
+        """True se o EAN já foi consultado (cadastrado ou não) e ainda vale."""
+        with self._lock:
+            return ean in self._cache
+
+    def guardar(self, produtos: dict):
+        """Guarda de uma vez o resultado de uma consulta em lote {ean: dict ou None}."""
+        with self._lock:
+            for ean, produto in produtos.items():
+                self._cache[ean] = produto if produto is not None else _NAO_CADASTRADO
+
+    def invalidar(self, eans):
+        """Remove apenas os EANs informados."""
+        with self._lock:
+            for ean in eans:
+                self._cache.pop(ean, None)
+
+    def limpar(self):
+        with self._lock:
+            self._cache.clear()
+
+
+cache_produtos = CacheProdutos()
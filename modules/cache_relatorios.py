@@ -0,0 +1,84 @@
+import hashlib
+import os
+import threading
+import pandas as pd
+from cachetools import LRUCache
+from modules import esquema
+
+
+class CacheRelatorios:
+    """
+    Resultado do processamento de relatórios enviados, guardado pelo hash do
+    conteúdo do arquivo: o mesmo CSV não é lido de novo a cada rerun.
+
+    - maxsize: quantos relatórios ficam em memória (LRU)
+    - diretorio: se informado, também grava cada resultado em Parquet e o
+      reaproveita depois de um reinício do processo
+    - max_arquivos: quantos Parquets manter no diretório (apaga os mais antigos)
+    """
+
+    def __init__(self, maxsize: int = 4, diretorio: str = None, max_arquivos: int = 20):
+        self._cache = LRUCache(maxsize=maxsize)
+        self._lock = threading.Lock()
+        self._diretorio = diretorio
+        self._max_arquivos = max_arquivos
+        if diretorio:
+            os.makedirs(diretorio, exist_ok=True)
+
+    @staticmethod
+    def chave(conteudo: bytes) -> str:
+        return hashlib.blake2b(conteudo, digest_size=16).hexdigest()
+
+    def _caminho(self, chave):
+        return os.path.join(self._diretorio, f"{chave}.parquet")
+
+    def _ler_disco(self, chave):
+        caminho = self._caminho(chave)
+        if not os.path.exists(caminho):
+            return None
+        try:
+            # O Parquet devolve o texto como string[python]: volta aos tipos compactos
+            df = esquema.compactar(pd.read_parquet(caminho))
+            os.utime(caminho)  # mais recente: é o último a ser apagado
+            return df
+        except Exception as e:
+            print(f"Cache de relatório ilegível, processando de novo: {e}")
+            return None
+
+    def _gravar_disco(self, chave, df):
+        try:
+            df.to_parquet(self._caminho(chave), index=False)
+            arquivos = sorted(
+                (os.path.join(self._diretorio, nome) for nome in os.listdir(self._diretorio)
+                 if nome.endswith(".parquet")),
+                key=os.path.getmtime)
+            for antigo in arquivos[:-self._max_arquivos]:
+                os.remove(antigo)
+        except Exception as e:
+            # Cache em disco é só atalho: sem ele o relatório continua funcionando
+            print(f"Não foi possível gravar o cache do relatório: {e}")
+
+    def obter(self, conteudo: bytes, processar):
+        """
+        DataFrame do relatório `conteudo`; em caso de falta chama
+        `processar(conteudo)` e guarda o resultado. O DataFrame devolvido é
+        compartilhado entre as sessões: quem precisar alterar deve copiar.
+        """
+        chave = self.chave(conteudo)
+        with self._lock:
+            df = self._cache.get(chave)
+        if df is not None:
+            return df
+
+        df = self._ler_disco(chave) if self._diretorio else None
+        if df is None:
+            df = processar(conteudo)
+            if self._diretorio:
+                self._gravar_disco(chave, df)
+        with self._lock:
+            self._cache[chave] = df
+        return df
+
+    def limpar(self):
+        with self._lock:
+            self._cache.clear()
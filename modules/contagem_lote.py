@@ -0,0 +1,148 @@
+import re
+import streamlit as st
+import pandas as pd
+import database_api as db
+from modules.scanner import get_barcodes_from_image, desenhar_caixas
+
+# Opção extra do rádio de leitura nas páginas de contagem (admin e usuário)
+OPCAO_VARIOS_CODIGOS = "🧺 Vários Códigos numa Foto"
+
+
+def _mostrar_problemas(resultado: dict):
+    """Linhas de add_counts_bulk que não foram gravadas, com o motivo."""
+    if resultado["invalidos"]:
+        st.error(f"❌ Linhas com EAN ou quantidade inválidos: {', '.join(map(str, resultado['invalidos']))}")
+    if resultado["nao_cadastrados"]:
+        st.warning(f"⚠️ EANs não cadastrados: {', '.join(map(str, resultado['nao_cadastrados']))}")
+    if resultado["falhas"]:
+        st.error(f"❌ Não gravados (tente novamente): {', '.join(map(str, resultado['falhas']))}")
+
+
+def exibir_leitura_varios(user_uid: str):
+    """
+    Contagem de uma prateleira (ou folha de etiquetas) com uma foto só:
+    lê todos os códigos, resolve os produtos numa única consulta e registra
+    as quantidades informadas na tabela.
+    """
+    st.info("Fotografe a prateleira ou a folha de etiquetas: todos os códigos visíveis serão lidos.")
+    foto = st.camera_input("Foto dos Códigos", key="foto_varios_codigos")
+    if not foto:
+        return
+
+    lidos = get_barcodes_from_image(foto)
+    if not lidos:
+        st.error("❌ Nenhum código lido na foto. Aproxime a câmera ou melhore a iluminação.")
+        return
+    st.image(desenhar_caixas(foto, lidos), caption=f"{len(lidos)} código(s) lido(s)",
+             use_container_width=True)
+
+    produtos = db.get_products_info([item["ean"] for item in lidos])
+    linhas, nao_encontrados, vistos = [], [], set()
+    for item in lidos:
+        produto = produtos.get(db.sanitizar_ean(item["ean"]))
+        if not produto:
+            nao_encontrados.append(item["ean"])
+            continue
+        # Usa o EAN como está gravado (UPC-A pode estar com 12 ou 13 dígitos)
+        if produto["ean"] in vistos:
+            continue
+        vistos.add(produto["ean"])
+        linhas.append({
+            "EAN": produto["ean"],
+            "Descrição": produto.get("descricao", ""),
+            "EMB": produto.get("emb", ""),
+            "Quantidade": 0.0,
+        })
+
+    if nao_encontrados:
+        st.warning(f"⚠️ Códigos inválidos ou não cadastrados: {', '.join(nao_encontrados)}")
+    if not linhas:
+        return
+
+    with st.form("form_contagem_varios"):
+        editado = st.data_editor(
+            pd.DataFrame(linhas),
+            disabled=["EAN", "Descrição", "EMB"],
+            column_config={
+                "Quantidade": st.column_config.NumberColumn(min_value=0.0, step=0.001, format="%.3f")
+            },
+            hide_index=True,
+            use_container_width=True,
+        )
+        if st.form_submit_button("Registrar contagens"):
+            registrar = editado[editado["Quantidade"] > 0]
+            if registrar.empty:
+                st.warning("Informe a quantidade de pelo menos um produto.")
+                return
+            resultado = db.add_counts_bulk(user_uid, zip(registrar["EAN"], registrar["Quantidade"]))
+            st.session_state.scanner_active = False
+            mensagem = f"📊 {resultado['registrados']} contagem(ns) registrada(s)!"
+            if resultado["invalidos"] or resultado["nao_cadastrados"] or resultado["falhas"]:
+                # Sem rerun, para os avisos ficarem na tela; o scanner já está
+                # fechado, então um segundo clique não registra tudo de novo
+                st.success(mensagem)
+                _mostrar_problemas(resultado)
+                return
+            st.session_state.count_message = mensagem
+            st.rerun()
+
+
+# --- Lista de contagens (coletor de dados / CSV) ---
+# Separador entre EAN e quantidade: ; , tab ou espaço. Linha só com o EAN vale 1
+# (coletores que bipam unidade por unidade).
+SEPARADOR_LISTA = re.compile(r"\s*[;,\t ]\s*")
+
+
+def ler_lista_contagens(texto: str):
+    """Converte o texto colado (uma leitura por linha) em [(ean, quantidade)]."""
+    itens = []
+    for linha in texto.splitlines():
+        linha = linha.strip()
+        if not linha:
+            continue
+        partes = SEPARADOR_LISTA.split(linha, maxsplit=1)
+        quantidade = partes[1].replace(",", ".") if len(partes) > 1 else 1
+        itens.append((partes[0], quantidade))
+    return itens
+
+
+def ler_arquivo_contagens(arquivo):
+    """CSV/TXT do coletor: mesmo formato da lista colada, com ou sem cabeçalho."""
+    itens = ler_lista_contagens(arquivo.getvalue().decode("latin1"))
+    # Cabeçalho ("ean;quantidade"): a primeira linha não tem dígitos no EAN
+    if itens and not re.search(r"\d", str(itens[0][0])):
+        itens = itens[1:]
+    return itens
+
+
+def exibir_lancamento_em_lote(user_uid: str):
+    """Lançamento de uma lista inteira de contagens (fim de turno do coletor)."""
+    with st.expander("📥 Lançar lista de contagens (coletor / CSV)"):
+        st.caption("Uma leitura por linha: `EAN;quantidade`. Linhas só com o EAN contam 1 unidade; "
+                   "EANs repetidos são somados.")
+        origem = st.radio("Origem", ["Colar lista", "Arquivo CSV/TXT"], horizontal=True,
+                          key="origem_lote_contagens")
+        # Limpa a lista depois do envio: clicar de novo não conta tudo outra vez
+        with st.form("form_contagem_lote", clear_on_submit=True):
+            if origem == "Colar lista":
+                texto = st.text_area("Leituras", height=200)
+                arquivo = None
+            else:
+                texto = ""
+                arquivo = st.file_uploader("Arquivo do coletor", type=["csv", "txt"])
+            enviar = st.form_submit_button("Registrar lista")
+
+        if not enviar:
+            return
+        try:
+            itens = ler_arquivo_contagens(arquivo) if arquivo else ler_lista_contagens(texto)
+        except Exception as e:
+            st.error(f"❌ Não foi possível ler o arquivo: {e}")
+            return
+        if not itens:
+            st.warning("Nenhuma leitura informada.")
+            return
+
+        resultado = db.add_counts_bulk(user_uid, itens)
+        st.success(f"📊 {resultado['linhas']} linha(s) lidas, {resultado['registrados']} produto(s) registrados.")
+        _mostrar_problemas(resultado)
@@ -0,0 +1,64 @@
+import threading
+from cachetools import TTLCache
+
+POR_PAGINA_USUARIOS = 1000
+
+
+class DiretorioUsuarios:
+    """
+    Lista completa dos usuários do Supabase Auth, compartilhada pelo processo.
+    O list_users do Auth é paginado no servidor; aqui todas as páginas são lidas
+    e o resultado fica guardado por `ttl` segundos (ou até invalidar()).
+
+    - listar_pagina(pagina, por_pagina): lista de usuários da página (começa em 1)
+    """
+
+    def __init__(self, listar_pagina, por_pagina: int = POR_PAGINA_USUARIOS, ttl: float = 300):
+        self._listar_pagina = listar_pagina
+        self._por_pagina = por_pagina
+        self._cache = TTLCache(maxsize=1, ttl=ttl)
+        # Um carregamento por vez: as outras sessões esperam e usam o resultado
+        self._lock = threading.Lock()
+
+    def _carregar(self):
+        usuarios = []
+        pagina = 1
+        while True:
+            lote = self._listar_pagina(pagina, self._por_pagina) or []
+            usuarios.extend(lote)
+            if len(lote) < self._por_pagina:
+                break
+            pagina += 1
+        mapa = {
+            u.id: {
+                "username": (u.user_metadata or {}).get("username") or u.email,
+                "email": u.email,
+                "role": (u.user_metadata or {}).get("role", "user"),
+            }
+            for u in usuarios
+        }
+        return usuarios, mapa
+
+    def _dados(self):
+        with self._lock:
+            dados = self._cache.get("usuarios")
+            if dados is None:
+                dados = self._carregar()
+                self._cache["usuarios"] = dados
+            return dados
+
+    def usuarios(self) -> list:
+        """Todos os usuários (objetos User do Auth)."""
+        return list(self._dados()[0])
+
+    def mapa(self) -> dict:
+        """{uid: {"username", "email", "role"}}"""
+        return self._dados()[1]
+
+    def nomes(self) -> dict:
+        """{uid: nome de usuário (ou e-mail, se não tiver nome)}"""
+        return {uid: info["username"] for uid, info in self.mapa().items()}
+
+    def invalidar(self):
+        with self._lock:
+            self._cache.clear()
@@ -0,0 +1,120 @@
+import re
+import numpy as np
+import pandas as pd
+
+
+def sanitizar_ean(ean_raw):
+    """
+    Só os dígitos do código. Um GTIN-14 válido fica com 14 dígitos (ou vira o
+    EAN-13, se o indicador for 0); acima de 13 dígitos, fora isso, ficam os
+    13 últimos.
+    """
+    if ean_raw is None:
+        return None
+    ean = str(ean_raw).strip().replace("\n", "").replace(
+        "\t", "").replace("\r", "").replace("'", "").replace('"', "")
+    try:
+        ean = ean.replace(",", ".")
+        if "e" in ean.lower():
+            ean = str(int(float(ean)))
+    except (ValueError, OverflowError):
+        pass
+    ean = re.sub(r"\D", "", ean)
+    # Valida antes de cortar: o corte estragaria o verificador do GTIN-14
+    if len(ean) == 14 and gtin_valido(ean) and not ean.startswith("0"):
+        return ean
+    return ean[-13:] if ean and len(ean) > 13 else ean or None
+
+
+def sanitizar_ean_series(serie: pd.Series) -> pd.Series:
+    """
+    Versão vetorizada de sanitizar_ean para colunas inteiras: mesmo resultado,
+    valor a valor (inclusive None para vazios, GTIN-14 e os 13 últimos dígitos).
+
+    Fora da notação científica, sanitizar_ean equivale a "só os dígitos, os 13
+    últimos (salvo GTIN-14 válido)", o que roda em kernels do Arrow. As linhas
+    com "e" (ex.: "7,89E+12") e as com caracteres não-ASCII (dígitos Unicode,
+    que o regex do Arrow não reconhece) passam pela função escalar.
+    """
+    texto = serie.astype(str).astype("string[pyarrow]")
+    especiais = (texto.str.contains("e", case=False, regex=False)
+                 | texto.str.contains(r"[^\x00-\x7F]", regex=True)).to_numpy(dtype=bool)
+
+    digitos = texto.str.replace(r"\D", "", regex=True)
+    resultado = digitos.str.slice(-13).astype(object)
+    catorze = (digitos.str.len() == 14).fillna(False).to_numpy(dtype=bool)
+    if catorze.any():
+        candidatos = digitos[catorze].astype(object)
+        manter = (~ean_invalido_series(candidatos) & ~candidatos.str.startswith("0")).to_numpy(dtype=bool)
+        resultado[np.flatnonzero(catorze)[manter]] = candidatos[manter]
+    if especiais.any():
+        resultado[especiais] = serie[especiais].map(sanitizar_ean)
+    return resultado.where(resultado != "", None)
+
+
+# --- GS1 (EAN-8, UPC-A, EAN-13, GTIN-14) ---
+# Tamanhos com dígito verificador GS1. Códigos de outros tamanhos são tratados
+# como códigos internos da loja e não são validados.
+TAMANHOS_GTIN = (8, 12, 13, 14)
+
+
+def digito_verificador(corpo: str) -> int:
+    """Dígito verificador GS1 para os dígitos `corpo` (sem o verificador)."""
+    # Da direita para a esquerda os pesos alternam 3, 1, 3, 1...
+    soma = sum(int(d) * (3 if i % 2 == 0 else 1)
+               for i, d in enumerate(reversed(corpo)))
+    return (10 - soma % 10) % 10
+
+
+def gtin_valido(codigo: str) -> bool:
+    """True se `codigo` (só dígitos) tem tamanho GTIN e o verificador confere."""
+    if not codigo or not codigo.isascii() or not codigo.isdigit() or len(codigo) not in TAMANHOS_GTIN:
+        return False
+    return digito_verificador(codigo[:-1]) == int(codigo[-1])
+
+
+def ean_invalido(ean) -> bool:
+    """
+    True quando o EAN (já sanitizado) tem tamanho GTIN mas o dígito verificador
+    não confere: leitura errada ou erro de digitação. Serve para recusar o
+    código antes de qualquer consulta ao banco.
+    """
+    return bool(ean) and len(ean) in TAMANHOS_GTIN and not gtin_valido(ean)
+
+
+def variantes_gtin(ean):
+    """
+    Formas sob as quais o mesmo produto pode estar gravado no banco:
+    o UPC-A de 12 dígitos e o seu EAN-13 com zero à esquerda.
+    """
+    if not ean:
+        return []
+    if len(ean) == 12:
+        return [ean, "0" + ean]
+    if len(ean) == 13 and ean.startswith("0"):
+        return [ean, ean[1:]]
+    return [ean]
+
+
+def ean_invalido_series(serie: pd.Series) -> pd.Series:
+    """ean_invalido vetorizado (a série já deve estar sanitizada)."""
+    texto = serie.fillna("").astype(str)
+    tamanhos = texto.str.len()
+    invalido = pd.Series(False, index=serie.index)
+    for tamanho in TAMANHOS_GTIN:
+        mascara = (tamanhos == tamanho).to_numpy()
+        if not mascara.any():
+            continue
+        codigos = texto[mascara]
+        so_ascii = codigos.str.fullmatch(r"[0-9]+").to_numpy(dtype=bool)
+        ok = np.zeros(len(codigos), dtype=bool)
+        if so_ascii.any():
+            digitos = np.frombuffer(
+                "".join(codigos[so_ascii]).encode("ascii"), dtype=np.uint8
+            ).reshape(-1, tamanho) - ord("0")
+            # Peso 3 nas posições ímpares contadas a partir do verificador (que tem peso 1)
+            pesos = np.where((tamanho - 1 - np.arange(tamanho)) % 2 == 1, 3, 1)
+            ok[so_ascii] = (digitos.astype(np.int64) @ pesos) % 10 == 0
+        invalido[mascara] = ~ok
+    return invalido
+
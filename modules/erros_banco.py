@@ -0,0 +1,28 @@
+# Classes SQLSTATE que dizem respeito aos dados enviados: repetir o mesmo
+# pedido dá sempre o mesmo erro.
+#   22xxx: valor inválido (ex.: 22P02 texto onde se espera número/uuid)
+#   23xxx: restrição violada (23502 not null, 23503 FK, 23505 único, 23514 check)
+CLASSES_ERRO_DE_DADOS = ("22", "23")
+CODIGOS_ERRO_DE_DADOS = (
+    "21000",  # ON CONFLICT DO UPDATE tocando a mesma linha duas vezes
+    "42501",  # sem permissão (RLS)
+)
+
+
+def codigo_erro(erro):
+    """Código do erro do PostgREST/Postgres (APIError.code), ou None."""
+    codigo = getattr(erro, "code", None)
+    return str(codigo) if codigo else None
+
+
+def erro_de_dados(erro) -> bool:
+    """
+    True só para erros em que o problema é o próprio conteúdo do pedido.
+    Todo o resto (rede, 5xx/503, 57014 statement timeout, PGRST301 JWT
+    expirado, 40001/40P01 serialização/deadlock, erro sem código) pode
+    passar numa nova tentativa.
+    """
+    codigo = codigo_erro(erro)
+    if codigo is None:
+        return False
+    return codigo[:2] in CLASSES_ERRO_DE_DADOS or codigo in CODIGOS_ERRO_DE_DADOS
@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+
+# Tipos compactos dos DataFrames que ficam em memória (caches e sessões).
+# - texto livre e EAN: string do Arrow (bytes contíguos, sem um objeto Python por célula)
+# - seção, grupo e embalagem: categoria (poucos valores repetidos em milhares de linhas)
+TIPO_TEXTO = "string[pyarrow]"
+COLUNAS_TEXTO = ("ean", "descricao", "usuario_uid")
+COLUNAS_CATEGORIA = ("secao", "grupo", "emb")
+COLUNAS_QUANTIDADE = ("quantidade", "estoque_sistema", "estoque_contado")
+
+# Quantidades são contadas com até 3 casas (KG/L); float32 só quando
+# todas as linhas voltam iguais nessa precisão
+CASAS_QUANTIDADE = 3
+TOLERANCIA_FLOAT32 = 5e-4
+
+
+def quantidade_compacta(serie: pd.Series) -> pd.Series:
+    """float32 se não perder nenhuma das 3 casas decimais; senão float64."""
+    valores = pd.to_numeric(serie, errors="coerce").astype("float64")
+    reduzidos = valores.astype("float32")
+    if np.allclose(reduzidos.to_numpy(dtype="float64"), valores.to_numpy(),
+                   rtol=0, atol=TOLERANCIA_FLOAT32, equal_nan=True):
+        return reduzidos
+    return valores
+
+
+def quantidade_exata(serie: pd.Series) -> pd.Series:
+    """
+    float64 arredondado nas 3 casas: desfaz o ruído do float32 antes de
+    fazer contas ou formatar para exibição.
+    """
+    valores = pd.to_numeric(serie, errors="coerce")
+    if valores.dtype == "float32":
+        return valores.astype("float64").round(CASAS_QUANTIDADE)
+    return valores
+
+
+def compactar(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Converte as colunas conhecidas para os tipos compactos (as demais ficam
+    como estão). Monta um DataFrame novo a partir das colunas, sem copiar as
+    que já estão no tipo certo.
+    """
+    colunas = {}
+    for nome, serie in df.items():
+        if nome in COLUNAS_TEXTO and serie.dtype != TIPO_TEXTO:
+            serie = serie.astype(TIPO_TEXTO)
+        elif nome in COLUNAS_CATEGORIA and not isinstance(serie.dtype, pd.CategoricalDtype):
+            serie = serie.astype("category")
+        elif nome in COLUNAS_QUANTIDADE and serie.dtype != "float32":
+            serie = quantidade_compacta(serie)
+        colunas[nome] = serie
+    return pd.DataFrame(colunas, index=df.index, copy=False)
+
+
+def como_texto(df: pd.DataFrame, colunas=None) -> pd.DataFrame:
+    """
+    Volta as colunas compactas para object (None nos vazios), para quem monta
+    payloads JSON ou compara colunas vindas de fontes diferentes. `colunas`
+    escolhe (e ordena) as colunas sem a cópia que df[lista] faria.
+    """
+    resultado = {}
+    for nome in (colunas or df.columns):
+        serie = df[nome]
+        if serie.dtype == TIPO_TEXTO or isinstance(serie.dtype, pd.CategoricalDtype):
+            serie = serie.astype(object).where(serie.notna(), None)
+        resultado[nome] = serie
+    return pd.DataFrame(resultado, index=df.index, copy=False)
+
+
+def memoria(df: pd.DataFrame) -> int:
+    """Bytes ocupados pelo DataFrame (contando o conteúdo dos textos)."""
+    return int(df.memory_usage(deep=True).sum())
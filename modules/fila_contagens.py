@@ -0,0 +1,201 @@
+import atexit
+import os
+import sqlite3
+import threading
+import uuid
+
+
+class FilaContagens:
+    """
+    Fila write-behind para as contagens.
+    Cada lançamento é gravado primeiro num diário SQLite local (sobrevive a um
+    reinício do processo) e uma thread em segundo plano envia os lançamentos
+    pendentes em lote, já somados por (usuario_uid, ean).
+
+    Cada envio marca os lançamentos com um id (`envio`) antes de sair; se o
+    envio for interrompido, os mesmos itens voltam com os mesmos ids, e o banco
+    (sql/009) ignora os que já aplicou. Um item que o banco recusa sozinho
+    (erro que não é de rede) vai para a tabela `rejeitados` e não trava os demais.
+
+    - enviar_lote(itens): recebe uma lista de dicts {id, usuario_uid, ean, quantidade}
+      e devolve a lista dos itens efetivamente gravados no banco.
+    - erro_transitorio(erro): True se vale tentar de novo mais tarde (rede,
+      banco instável); sem ele todo erro é tratado como transitório
+    - max_pendentes: quantidade de lançamentos que dispara um envio imediato
+    - intervalo: tempo máximo (s) que um lançamento espera na fila
+    """
+
+    def __init__(self, caminho: str, enviar_lote, max_pendentes: int = 200, intervalo: float = 2.0,
+                 erro_transitorio=None):
+        os.makedirs(os.path.dirname(caminho) or ".", exist_ok=True)
+        self._enviar_lote = enviar_lote
+        self._erro_transitorio = erro_transitorio or (lambda erro: True)
+        self._max_pendentes = max_pendentes
+        self._intervalo = intervalo
+        self._conn = sqlite3.connect(caminho, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS lancamentos (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                usuario_uid TEXT NOT NULL,
+                ean TEXT NOT NULL,
+                quantidade REAL NOT NULL
+            )
+        """)
+        # Diários criados antes do envio idempotente não têm a coluna
+        colunas = [linha[1] for linha in self._conn.execute("PRAGMA table_info(lancamentos)")]
+        if "envio" not in colunas:
+            self._conn.execute("ALTER TABLE lancamentos ADD COLUMN envio TEXT")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS rejeitados (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                usuario_uid TEXT NOT NULL,
+                ean TEXT NOT NULL,
+                quantidade REAL NOT NULL,
+                erro TEXT,
+                rejeitado_em TEXT NOT NULL DEFAULT (datetime('now'))
+            )
+        """)
+        self._conn.commit()
+        self._lock = threading.Lock()        # acesso à conexão SQLite
+        self._lock_envio = threading.Lock()  # um envio por vez
+        self._acordar = threading.Event()
+        self._parar = threading.Event()
+        self._thread = None
+        self._lock_thread = threading.Lock()
+        self._registrado_atexit = False
+        # Lançamentos que ficaram no diário de uma execução anterior
+        if self.pendentes():
+            self.iniciar()
+
+    def adicionar(self, usuario_uid, ean, quantidade: float):
+        """Grava o lançamento no diário e retorna sem esperar pela rede."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO lancamentos (usuario_uid, ean, quantidade) VALUES (?, ?, ?)",
+                (usuario_uid, ean, float(quantidade)))
+            self._conn.commit()
+        self.iniciar()
+        if self.pendentes() >= self._max_pendentes:
+            self._acordar.set()
+
+    def pendentes(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM lancamentos").fetchone()[0]
+
+    def rejeitados(self) -> list:
+        """Itens recusados pelo banco: [{usuario_uid, ean, quantidade, erro, rejeitado_em}]."""
+        with self._lock:
+            linhas = self._conn.execute(
+                "SELECT usuario_uid, ean, quantidade, erro, rejeitado_em "
+                "FROM rejeitados ORDER BY id").fetchall()
+        return [{"usuario_uid": uid, "ean": ean, "quantidade": qtd, "erro": erro,
+                 "rejeitado_em": quando} for uid, ean, qtd, erro, quando in linhas]
+
+    def limpar_rejeitados(self):
+        """Descarta os rejeitados já vistos pelo administrador."""
+        with self._lock:
+            self._conn.execute("DELETE FROM rejeitados")
+            self._conn.commit()
+
+    def _marcar_envio(self):
+        """
+        Id do envio a fazer: o de um envio interrompido (mesmos itens, mesmos
+        ids) ou um novo, marcado agora em tudo o que está no diário.
+        """
+        linha = self._conn.execute(
+            "SELECT envio FROM lancamentos WHERE envio IS NOT NULL LIMIT 1").fetchone()
+        if linha is not None:
+            return linha[0]
+        if not self._conn.execute("SELECT 1 FROM lancamentos LIMIT 1").fetchone():
+            return None
+        envio = uuid.uuid4().hex
+        self._conn.execute("UPDATE lancamentos SET envio = ? WHERE envio IS NULL", (envio,))
+        self._conn.commit()
+        return envio
+
+    def _enviar(self, itens):
+        """
+        (gravados, rejeitados). Um lote recusado é dividido ao meio até isolar
+        o item ruim; erro transitório sobe e tudo fica no diário.
+        """
+        try:
+            return self._enviar_lote(itens), []
+        except Exception as e:
+            if self._erro_transitorio(e):
+                raise
+            if len(itens) == 1:
+                print(f"Contagem recusada pelo banco ({itens[0]['ean']}): {e}")
+                return [], [{**itens[0], "erro": str(e)}]
+        meio = len(itens) // 2
+        gravados, rejeitados = self._enviar(itens[:meio])
+        gravados_fim, rejeitados_fim = self._enviar(itens[meio:])
+        return gravados + gravados_fim, rejeitados + rejeitados_fim
+
+    def flush(self) -> int:
+        """
+        Envia um lote do diário (o interrompido antes, se houver). Retorna
+        quantos itens saíram do diário (gravados ou rejeitados).
+        """
+        with self._lock_envio:
+            with self._lock:
+                envio = self._marcar_envio()
+                if envio is None:
+                    return 0
+                linhas = self._conn.execute(
+                    "SELECT usuario_uid, ean, SUM(quantidade) FROM lancamentos "
+                    "WHERE envio = ? GROUP BY usuario_uid, ean", (envio,)).fetchall()
+
+            itens = [{"id": f"{envio}:{uid}:{ean}", "usuario_uid": uid, "ean": ean, "quantidade": qtd}
+                     for uid, ean, qtd in linhas]
+            gravados, rejeitados = self._enviar(itens)
+
+            # Só sai do diário o que o banco confirmou ou recusou; o resto fica
+            # para o próximo envio, com os mesmos ids
+            with self._lock:
+                self._conn.executemany(
+                    "INSERT INTO rejeitados (usuario_uid, ean, quantidade, erro) VALUES (?, ?, ?, ?)",
+                    [(item["usuario_uid"], item["ean"], item["quantidade"], item["erro"])
+                     for item in rejeitados])
+                self._conn.executemany(
+                    "DELETE FROM lancamentos WHERE envio = ? AND usuario_uid = ? AND ean = ?",
+                    [(envio, item["usuario_uid"], item["ean"]) for item in gravados + rejeitados])
+                self._conn.commit()
+            return len(gravados) + len(rejeitados)
+
+    def drain(self):
+        """Esvazia a fila e encerra a thread (usar em testes e no desligamento)."""
+        self._parar.set()
+        self._acordar.set()
+        with self._lock_thread:
+            thread, self._thread = self._thread, None
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+        try:
+            while self.pendentes() and self.flush():
+                pass
+        except Exception as e:
+            # No desligamento não há a quem avisar: o diário é lido na próxima execução
+            print(f"Contagens pendentes ficam no diário para o próximo envio: {e}")
+        self._parar.clear()
+
+    def iniciar(self):
+        with self._lock_thread:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(
+                target=self._laco, name="fila-contagens", daemon=True)
+            self._thread.start()
+            if not self._registrado_atexit:
+                atexit.register(self.drain)
+                self._registrado_atexit = True
+
+    def _laco(self):
+        while not self._parar.is_set():
+            self._acordar.wait(self._intervalo)
+            self._acordar.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                # Sem rede ou erro no banco: os lançamentos continuam no diário
+                print(f"Erro ao enviar contagens pendentes: {e}")
@@ -0,0 +1,95 @@
+import threading
+import time
+
+CAMPOS_PRODUTO = ("ean", "descricao", "emb", "secao", "grupo")
+
+
+class RegistroProduto:
+    """Linha compacta do catálogo (sem o __dict__ de cada objeto)."""
+    __slots__ = CAMPOS_PRODUTO
+
+    def __init__(self, ean, descricao="", emb="", secao="", grupo=""):
+        self.ean = ean
+        self.descricao = descricao
+        self.emb = emb
+        self.secao = secao
+        self.grupo = grupo
+
+    def como_dict(self) -> dict:
+        # Mesmo formato de linha que o Supabase devolve em get_product_info
+        return {campo: getattr(self, campo) for campo in CAMPOS_PRODUTO}
+
+
+class IndiceProdutos:
+    """
+    Catálogo inteiro em memória, indexado pelo EAN sanitizado.
+    Depois de pronto responde as consultas sem ir à rede; uma thread em segundo
+    plano verifica a versão do catálogo e recarrega quando ela muda.
+
+    - carregar_paginas(): iterável de páginas (listas de dicts) da tabela produtos
+    - consultar_versao(): qualquer valor comparável que mude quando o catálogo muda
+    - chave(ean): normalização aplicada ao EAN antes de indexar
+    """
+
+    def __init__(self, carregar_paginas, consultar_versao, chave, intervalo: float = 60):
+        self._carregar_paginas = carregar_paginas
+        self._consultar_versao = consultar_versao
+        self._chave = chave
+        self._intervalo = intervalo
+        self._registros = {}
+        self._versao = None
+        self._pronto = False
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def pronto(self) -> bool:
+        return self._pronto
+
+    def __len__(self):
+        return len(self._registros)
+
+    def obter(self, ean):
+        registro = self._registros.get(ean)
+        return registro.como_dict() if registro else None
+
+    def carregar(self):
+        """Lê a tabela inteira num dicionário novo e só então troca o atual."""
+        versao = self._consultar_versao()
+        novos = {}
+        for pagina in self._carregar_paginas():
+            for linha in pagina:
+                ean = self._chave(linha.get("ean"))
+                if ean:
+                    novos[ean] = RegistroProduto(
+                        ean, *(linha.get(campo) or "" for campo in CAMPOS_PRODUTO[1:]))
+        with self._lock:
+            self._registros = novos
+            self._versao = versao
+            self._pronto = True
+
+    def aplicar(self, linhas):
+        """Reflete no índice as gravações feitas por este processo, sem esperar a recarga."""
+        with self._lock:
+            for linha in linhas:
+                ean = self._chave(linha.get("ean"))
+                if ean:
+                    self._registros[ean] = RegistroProduto(
+                        ean, *(str(linha.get(campo) or "") for campo in CAMPOS_PRODUTO[1:]))
+
+    def iniciar(self):
+        """Faz a primeira carga e a verificação periódica numa thread daemon."""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(
+            target=self._laco, name="indice-produtos", daemon=True)
+        self._thread.start()
+
+    def _laco(self):
+        while True:
+            try:
+                if not self._pronto or self._consultar_versao() != self._versao:
+                    self.carregar()
+            except Exception as e:
+                print(f"Erro ao atualizar índice de produtos: {e}")
+            time.sleep(self._intervalo)
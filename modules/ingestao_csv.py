@@ -0,0 +1,87 @@
+import pandas as pd
+from modules.ean import sanitizar_ean_series
+from modules import esquema, snapshots
+
+# Colunas do relatório de cadastro exportado pelo sistema
+COLUNAS_CADASTRO = ["Código", "Descrição", "EMB", "Quebra 2"]
+COLUNAS_PRODUTO = ["ean", "descricao", "emb", "secao", "grupo"]
+TAMANHO_BLOCO = 20_000
+
+REGEX_SECAO = r"Seção: \d+ - (.*?)(?:Grupo:|$)"
+REGEX_GRUPO = r"Grupo: \d+- (.*)"
+
+
+def _validar_colunas(arquivo):
+    """Lê só o cabeçalho e confere as colunas antes de processar o arquivo."""
+    cabecalho = pd.read_csv(arquivo, sep=";", encoding="latin1", nrows=0)
+    arquivo.seek(0)
+    faltando = [c for c in COLUNAS_CADASTRO if c not in cabecalho.columns]
+    if faltando:
+        raise KeyError(
+            f"Colunas ausentes no relatório: {faltando} (encontradas: {list(cabecalho.columns)})")
+
+
+def ler_relatorio_cadastro(arquivo, tamanho_bloco: int = TAMANHO_BLOCO):
+    """
+    Lê o relatório de cadastro em blocos e devolve, para cada bloco, um DataFrame
+    já normalizado com as colunas ean, descricao, emb, secao, grupo.
+
+    A seção só aparece em algumas linhas e vale para as seguintes (ffill); a
+    última seção de um bloco é levada para o início do próximo, então o
+    resultado é o mesmo de processar o arquivo inteiro de uma vez.
+    """
+    _validar_colunas(arquivo)
+    leitor = pd.read_csv(
+        arquivo, sep=";", encoding="latin1", usecols=COLUNAS_CADASTRO,
+        dtype=str, chunksize=tamanho_bloco
+    )
+
+    ultima_secao = None
+    for bloco in leitor:
+        quebra = bloco["Quebra 2"].astype(str)
+        secao = quebra.str.extract(REGEX_SECAO, expand=False).str.strip()
+        # Bloco sem nenhuma seção: mantém object em vez de virar float64
+        with pd.option_context("future.no_silent_downcasting", True):
+            secao = secao.ffill()
+            if ultima_secao is not None:
+                secao = secao.fillna(ultima_secao)
+        if secao.notna().any():
+            ultima_secao = secao.iloc[-1]
+        grupo = quebra.str.extract(REGEX_GRUPO, expand=False).str.strip().fillna("")
+
+        df = pd.DataFrame({
+            "ean": bloco["Código"],
+            "descricao": bloco["Descrição"],
+            "emb": bloco["EMB"],
+            "secao": secao,
+            "grupo": grupo,
+        })
+        df = df[df["ean"].notna()]
+
+        # 🔎 Normalização do EAN (mesma regra de sanitizar_ean)
+        df["ean"] = sanitizar_ean_series(df["ean"])
+        df = df[df["ean"].notna()]
+        yield df.reset_index(drop=True)
+
+
+def carregar_relatorio_cadastro(arquivo, tamanho_bloco: int = TAMANHO_BLOCO) -> pd.DataFrame:
+    """
+    Junta os blocos normalizados; só as 5 colunas do produto ficam em memória,
+    nos tipos compactos de modules/esquema.py.
+    """
+    blocos = list(ler_relatorio_cadastro(arquivo, tamanho_bloco))
+    if not blocos:
+        return esquema.compactar(pd.DataFrame(columns=COLUNAS_PRODUTO))
+    return esquema.compactar(pd.concat(blocos, ignore_index=True))
+
+
+def carregar_snapshot_produtos(arquivo) -> pd.DataFrame:
+    """Catálogo a partir de um snapshot Parquet/Arrow (ver modules/snapshots.py)."""
+    df = snapshots.importar(arquivo)
+    faltando = [c for c in COLUNAS_PRODUTO if c not in df.columns]
+    if faltando:
+        raise KeyError(
+            f"Colunas ausentes no snapshot: {faltando} (encontradas: {list(df.columns)})")
+    df = df[COLUNAS_PRODUTO]
+    df = df.assign(ean=sanitizar_ean_series(df["ean"].astype("string").astype(object)))
+    return esquema.compactar(df[df["ean"].notna()].reset_index(drop=True))
@@ -0,0 +1,194 @@
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+
+
+class ArmazemOffline:
+    """
+    Armazenamento local (SQLite) para contar sem conexão com o Supabase.
+
+    - produtos: espelho da tabela produtos, usado nas consultas de EAN offline
+    - contagens: total acumulado no aparelho por (usuario_uid, ean), com uma
+      versão que cresce a cada lançamento e a última versão já sincronizada
+    - conflitos: itens que o banco recusou na sincronização
+
+    O aparelho tem um identificador próprio (tabela meta) para o banco saber o
+    que já aplicou de cada um; ver sql/004_sincronizar_contagens.sql.
+    """
+
+    def __init__(self, caminho: str):
+        os.makedirs(os.path.dirname(caminho) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(caminho, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.executescript("""
+                PRAGMA journal_mode=WAL;
+                CREATE TABLE IF NOT EXISTS meta (
+                    chave TEXT PRIMARY KEY,
+                    valor TEXT
+                );
+                CREATE TABLE IF NOT EXISTS produtos (
+                    ean TEXT PRIMARY KEY,
+                    descricao TEXT, emb TEXT, secao TEXT, grupo TEXT
+                );
+                CREATE TABLE IF NOT EXISTS contagens (
+                    usuario_uid TEXT NOT NULL,
+                    ean TEXT NOT NULL,
+                    total REAL NOT NULL DEFAULT 0,
+                    versao INTEGER NOT NULL DEFAULT 0,
+                    versao_sincronizada INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (usuario_uid, ean)
+                );
+                CREATE TABLE IF NOT EXISTS conflitos (
+                    usuario_uid TEXT, ean TEXT, versao INTEGER,
+                    versao_banco INTEGER, total_banco REAL, registrado_em TEXT
+                );
+            """)
+            linha = self._conn.execute(
+                "SELECT valor FROM meta WHERE chave = 'dispositivo'").fetchone()
+            if linha:
+                self.dispositivo = linha[0]
+            else:
+                self.dispositivo = str(uuid.uuid4())
+                self._conn.execute(
+                    "INSERT INTO meta (chave, valor) VALUES ('dispositivo', ?)", (self.dispositivo,))
+            self._conn.commit()
+
+    # --- Produtos ---
+    def obter_produto(self, ean):
+        with self._lock:
+            linha = self._conn.execute(
+                "SELECT ean, descricao, emb, secao, grupo FROM produtos WHERE ean = ?", (ean,)).fetchone()
+        if not linha:
+            return None
+        return dict(zip(("ean", "descricao", "emb", "secao", "grupo"), linha))
+
+    def aplicar_produtos(self, registros):
+        """Insere/atualiza produtos no espelho local (mesmo formato do upsert do Supabase)."""
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO produtos (ean, descricao, emb, secao, grupo) VALUES (?, ?, ?, ?, ?)",
+                [(r.get("ean"), r.get("descricao"), r.get("emb"), r.get("secao"), r.get("grupo"))
+                 for r in registros])
+            self._conn.commit()
+
+    def espelhar_produtos(self, paginas):
+        """
+        Substitui o espelho inteiro pelas páginas lidas do banco. Baixa tudo
+        antes (sem segurar o lock durante a rede) e troca numa transação só:
+        se o download falhar no meio, o espelho anterior continua inteiro.
+        """
+        linhas = [(r.get("ean"), r.get("descricao"), r.get("emb"), r.get("secao"), r.get("grupo"))
+                  for pagina in paginas for r in pagina]
+        with self._lock:
+            try:
+                self._conn.execute("DELETE FROM produtos")
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO produtos (ean, descricao, emb, secao, grupo) VALUES (?, ?, ?, ?, ?)",
+                    linhas)
+                self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                raise
+
+    # --- Contagens ---
+    def registrar_contagem(self, usuario_uid, ean, quantidade: float):
+        with self._lock:
+            self._conn.execute("""
+                INSERT INTO contagens (usuario_uid, ean, total, versao) VALUES (?, ?, ?, 1)
+                ON CONFLICT (usuario_uid, ean) DO UPDATE
+                SET total = total + excluded.total, versao = versao + 1
+            """, (usuario_uid, ean, float(quantidade)))
+            self._conn.commit()
+
+    def pendentes(self, limite: int = None):
+        """Linhas com lançamentos ainda não confirmados pelo banco."""
+        sql = ("SELECT usuario_uid, ean, total, versao FROM contagens "
+               "WHERE versao > versao_sincronizada ORDER BY usuario_uid, ean")
+        if limite:
+            sql += f" LIMIT {int(limite)}"
+        with self._lock:
+            linhas = self._conn.execute(sql).fetchall()
+        return [{"usuario_uid": uid, "ean": ean, "total": total, "versao": versao}
+                for uid, ean, total, versao in linhas]
+
+    def confirmar(self, resultados):
+        """
+        Aplica a resposta do banco: 'aplicado' e 'duplicado' marcam a versão
+        como sincronizada; 'conflito' fica registrado para o administrador.
+        """
+        agora = datetime.now().isoformat(timespec="seconds")
+        with self._lock:
+            for r in resultados:
+                if r["status"] == "conflito":
+                    self._conn.execute(
+                        "INSERT INTO conflitos VALUES (?, ?, ?, ?, ?, ?)",
+                        (r["usuario_uid"], r["ean"], r["versao"],
+                         r.get("versao_banco"), r.get("total_banco"), agora))
+                # Em conflito também: a mesma versão não é reenviada a cada ciclo
+                self._conn.execute("""
+                    UPDATE contagens SET versao_sincronizada = MAX(versao_sincronizada, ?)
+                    WHERE usuario_uid = ? AND ean = ?
+                """, (r["versao"], r["usuario_uid"], r["ean"]))
+            self._conn.commit()
+
+    def conflitos(self):
+        with self._lock:
+            linhas = self._conn.execute(
+                "SELECT usuario_uid, ean, versao, versao_banco, total_banco, registrado_em FROM conflitos"
+            ).fetchall()
+        colunas = ("usuario_uid", "ean", "versao", "versao_banco", "total_banco", "registrado_em")
+        return [dict(zip(colunas, linha)) for linha in linhas]
+
+    def limpar_conflitos(self):
+        """Descarta os conflitos já vistos pelo administrador."""
+        with self._lock:
+            self._conn.execute("DELETE FROM conflitos")
+            self._conn.commit()
+
+
+def sincronizar(armazem: ArmazemOffline, enviar_lote, tamanho_lote: int = 500) -> dict:
+    """
+    Envia as contagens pendentes do armazém em lotes.
+    `enviar_lote(dispositivo, itens)` devolve a lista de resultados do banco.
+    Reenviar é seguro: o banco descarta versões que já aplicou.
+    """
+    resumo = {"aplicados": 0, "duplicados": 0, "conflitos": []}
+    anteriores = None
+    while True:
+        itens = armazem.pendentes(limite=tamanho_lote)
+        # Sem progresso (resposta não casou com nenhum item): para e tenta no próximo ciclo
+        if not itens or itens == anteriores:
+            break
+        anteriores = itens
+        resultados = enviar_lote(armazem.dispositivo, itens)
+        armazem.confirmar(resultados)
+        for r in resultados:
+            if r["status"] == "aplicado":
+                resumo["aplicados"] += 1
+            elif r["status"] == "duplicado":
+                resumo["duplicados"] += 1
+            else:
+                resumo["conflitos"].append(r)
+    return resumo
+
+
+def iniciar_sincronizacao(sincronizar_agora, intervalo: float = 30):
+    """Chama `sincronizar_agora()` periodicamente numa thread daemon até a conexão voltar e além."""
+    def laco():
+        while True:
+            try:
+                resumo = sincronizar_agora()
+                if resumo["conflitos"]:
+                    print(f"⚠️ {len(resumo['conflitos'])} contagem(ns) offline em conflito com o banco.")
+            except Exception as e:
+                # Ainda sem conexão: tenta de novo no próximo ciclo
+                print(f"Sincronização offline adiada: {e}")
+            time.sleep(intervalo)
+
+    thread = threading.Thread(target=laco, name="sincronizacao-offline", daemon=True)
+    thread.start()
+    return thread
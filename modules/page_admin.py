@@ -4,6 +4,11 @@ import database_api as db
 import sidebar_admin as sb
 from modules.scanner import get_barcode, get_barcode_from_image
 from modules.page_mudar_senha import show_mudar_senha
+from modules import ingestao_csv
+from modules import auditoria as motor_auditoria
+from modules import snapshots
+from modules.contagem_lote import (OPCAO_VARIOS_CODIGOS, exibir_leitura_varios,
+                                   exibir_lancamento_em_lote)
 
 
 # A função agora recebe o uid
@@ -19,6 +24,8 @@ def show_admin_page(username: str, user_uid: str):
         st.session_state.count_successful = False
 
     sb.admin_sidebar(username) 
+    exibir_conflitos_offline()
+    exibir_contagens_rejeitadas()
     if "pagina_admin" not in st.session_state:
         st.session_state["pagina_admin"] = "📦 Contagem de Inventário"
 
@@ -44,13 +51,49 @@ def show_admin_page(username: str, user_uid: str):
         show_mudar_senha()
 
 
+def exibir_conflitos_offline():
+    """Contagens offline que o banco recusou na sincronização (sql/004)."""
+    if db.armazem_offline is None:
+        return
+    conflitos = db.armazem_offline.conflitos()
+    if not conflitos:
+        return
+    st.warning(f"⚠️ {len(conflitos)} contagem(ns) guardadas no servidor durante a falta de conexão entraram em "
+               "conflito com o banco e não foram somadas. Confira e lance de novo se necessário.")
+    with st.expander("Ver conflitos da sincronização offline"):
+        df = pd.DataFrame(conflitos)
+        df.insert(0, "usuario", df["usuario_uid"].map(db.get_user_map()).fillna("Desconhecido"))
+        st.dataframe(df.drop(columns="usuario_uid"), use_container_width=True, hide_index=True)
+        if st.button("✔️ Marcar conflitos como vistos"):
+            db.armazem_offline.limpar_conflitos()
+            st.rerun()
+
+
+def exibir_contagens_rejeitadas():
+    """Contagens da fila write-behind que o banco recusou (ex.: EAN fora do catálogo)."""
+    if db.fila_contagens is None:
+        return
+    rejeitados = db.fila_contagens.rejeitados()
+    if not rejeitados:
+        return
+    st.warning(f"⚠️ {len(rejeitados)} contagem(ns) foram recusadas pelo banco e não foram somadas.")
+    with st.expander("Ver contagens recusadas"):
+        df = pd.DataFrame(rejeitados)
+        df.insert(0, "usuario", df["usuario_uid"].map(db.get_user_map()).fillna("Desconhecido"))
+        st.dataframe(df.drop(columns="usuario_uid"), use_container_width=True, hide_index=True)
+        if st.button("✔️ Marcar recusadas como vistas"):
+            db.fila_contagens.limpar_rejeitados()
+            st.rerun()
+
+
 def exibir_aba_contagem(user_uid: str):
     # A função da aba agora recebe o uid
     st.subheader("🛠️ Contagem de Inventário - Administrador")
     st.markdown("### 🧾 Identificar produto")
 
     tipo_leitura = st.radio("Escolha o método de leitura da câmera:", 
-                            ["📹 Leitor ao Vivo (Android/PC)", "📸 Tirar Foto (Ideal para iPhone)"], 
+                            ["📹 Leitor ao Vivo (Android/PC)", "📸 Tirar Foto (Ideal para iPhone)",
+                             OPCAO_VARIOS_CODIGOS], 
                             horizontal=True)
 
     if st.button("📷 Ativar Câmera / Leitor"):
@@ -59,7 +102,9 @@ def exibir_aba_contagem(user_uid: str):
     # O scanner só é mostrado se o estado for ativo
     if st.session_state.get("scanner_active", False):
         ean_lido = None
-        if "Tirar Foto" in tipo_leitura:
+        if tipo_leitura == OPCAO_VARIOS_CODIGOS:
+            exibir_leitura_varios(user_uid)
+        elif "Tirar Foto" in tipo_leitura:
             st.info("Tire uma foto bem nítida e focada do código de barras.")
             foto = st.camera_input("Foto do Código")
             if foto:
@@ -96,7 +141,10 @@ def exibir_aba_contagem(user_uid: str):
         ean = ean.strip()
         ean = db.sanitizar_ean(ean)
         produto = db.get_product_info(ean)
-        if produto:
+        if db.ean_invalido(ean):
+            # Leitura errada ou erro de digitação: não oferece o cadastro
+            st.error("❌ Código inválido (dígito verificador não confere). Leia ou digite novamente.")
+        elif produto:
             st.success(f"🟢 Produto encontrado: **{produto['descricao']}**")
         else:
             # Se o produto NÃO EXISTE, mostramos o formulário de cadastro
@@ -146,13 +194,16 @@ def exibir_aba_contagem(user_uid: str):
             contar = st.form_submit_button("Registrar")
             if contar:
                 try:
-                    db.add_or_update_count(user_uid, ean, quantidade)
+                    # Usa o EAN como está gravado (UPC-A pode estar com 12 ou 13 dígitos)
+                    db.add_or_update_count(user_uid, produto["ean"], quantidade)
                     st.session_state.count_message = f"📊 Contagem de {quantidade} para '{produto['descricao']}' registrada!"
                     st.session_state.count_successful = True
                     st.rerun()
                 except Exception as e:
                     st.error(f"Erro ao registrar contagem: {e}")
     
+    exibir_lancamento_em_lote(user_uid)
+
     with st.expander("Ver minhas contagens registadas"):
         # 1. Chamamos a nossa nova função, passando o UID do utilizador logado
         minhas_contagens = db.get_contagens_por_usuario(user_uid)
@@ -179,83 +230,86 @@ def exibir_aba_contagem(user_uid: str):
 
 
 # 📋 Aba 1 — Relatório de contagens
-def exibir_aba_relatorio():
-    st.subheader("📋 Gestão e Relatório de Contagens")
-
-    # Usamos o session_state para guardar os dados e comparar com as edições
-    # Carrega os dados do banco apenas uma vez para não perder as edições
-    if 'dados_contagem' not in st.session_state:
-        dados_brutos = db.get_relatorio_contagens_completo()
-        if not dados_brutos:
-            st.info("Nenhuma contagem registrada ainda.")
-            # Limpa o estado se não houver dados
-            if 'dados_contagem' in st.session_state:
-                del st.session_state.dados_contagem
-            return
-        st.session_state.dados_contagem = pd.DataFrame(dados_brutos)
+def _mudar_pagina_relatorio():
+    # A chave do number_input some quando ele não é desenhado (outra aba,
+    # relatório vazio); a página fica guardada numa chave só nossa
+    st.session_state.pagina_relatorio_atual = st.session_state.pagina_relatorio
 
-    # Se a sessão foi limpa, mas a página recarregou, sai
-    if 'dados_contagem' not in st.session_state or st.session_state.dados_contagem.empty:
-        st.info("Nenhuma contagem registrada ainda.")
-        return
 
-    contagens = st.session_state.dados_contagem.copy()
-
-    # Processamento dos dados para exibição
-    if "produtos" in contagens.columns and contagens["produtos"].notna().any():
-        produtos_df = pd.json_normalize(contagens["produtos"].dropna())
-        contagens_sem_produtos = contagens.drop(columns=["produtos"])
-        contagens = pd.concat([contagens_sem_produtos.reset_index(
-            drop=True), produtos_df.reset_index(drop=True)], axis=1)
+def exibir_aba_relatorio():
+    st.subheader("📋 Gestão e Relatório de Contagens")
 
-    users_from_auth = db.get_all_users()
-    user_map = {user.id: user.user_metadata.get(
-        "username", user.email) for user in users_from_auth}
-    contagens["usuario"] = contagens["usuario_uid"].map(
-        user_map).fillna("Desconhecido")
-    contagens["deletar"] = False
+    # uid -> nome, de todas as páginas do Auth (cache do processo)
+    user_map = db.get_user_map()
 
     # --- Filtros ---
+    # Os filtros vão para a consulta: a sessão guarda só a página visível
     st.markdown("#### Filtros")
 
-
     col1, col2, col3 = st.columns(3)
 
-    # O DataFrame base para os filtros é a tabela completa de contagens
-    df_para_filtrar = contagens.copy()
-
     # Filtro de Usuário
     with col1:
-        if 'usuario' in df_para_filtrar.columns:
-            usuarios_disponiveis = ['Todos'] + sorted(
-                [str(u) for u in df_para_filtrar['usuario'].dropna().unique() if str(u).strip() != ""]
-            )
-            usuario_selecionado = st.selectbox(
-                "Filtrar por Usuário", usuarios_disponiveis)
-            if usuario_selecionado != 'Todos':
-                df_para_filtrar = df_para_filtrar[df_para_filtrar['usuario'] == usuario_selecionado]
+        uids_com_contagem = db.get_usuarios_com_contagem()
+        if uids_com_contagem is None:
+            uids_com_contagem = list(user_map)
+        nomes_para_uid = {user_map.get(uid, "Desconhecido"): uid for uid in uids_com_contagem}
+        usuario_selecionado = st.selectbox(
+            "Filtrar por Usuário", ['Todos'] + sorted(nomes_para_uid))
+        usuario_uid = nomes_para_uid.get(usuario_selecionado)
 
     # Filtro de Seção
     with col2:
-        if 'secao' in df_para_filtrar.columns:
-            secoes_disponiveis = ['Todas'] + sorted(
-                [str(s) for s in df_para_filtrar['secao'].dropna().unique() if str(s).strip() != ""]
-            )
-            secao_selecionada = st.selectbox(
-                "Filtrar por Seção", secoes_disponiveis)
-            if secao_selecionada != 'Todas':
-                df_para_filtrar = df_para_filtrar[df_para_filtrar['secao'] == secao_selecionada]
+        secoes_disponiveis = ['Todas'] + sorted(
+            str(s) for s in db.get_all_secoes() if str(s).strip() != "")
+        secao_selecionada = st.selectbox(
+            "Filtrar por Seção", secoes_disponiveis)
+        secao = None if secao_selecionada == 'Todas' else secao_selecionada
 
     # Filtro de Grupo
     with col3:
-        if 'grupo' in df_para_filtrar.columns:
-            grupos_disponiveis = ['Todos'] + sorted(
-                [str(g) for g in df_para_filtrar['grupo'].dropna().unique() if str(g).strip() != ""]
-            )
-            grupo_selecionado = st.selectbox(
-                "Filtrar por Grupo", grupos_disponiveis)
-            if grupo_selecionado != 'Todos':
-                df_para_filtrar = df_para_filtrar[df_para_filtrar['grupo'] == grupo_selecionado]
+        grupos_disponiveis = ['Todos'] + sorted(
+            str(g) for g in db.get_all_grupos() if str(g).strip() != "")
+        grupo_selecionado = st.selectbox(
+            "Filtrar por Grupo", grupos_disponiveis)
+        grupo = None if grupo_selecionado == 'Todos' else grupo_selecionado
+
+    col_p1, col_p2 = st.columns([1, 3])
+    with col_p1:
+        por_pagina = st.selectbox("Linhas por página", [100, 200, 500], index=1)
+    filtros = (usuario_uid, secao, grupo, por_pagina)
+    # Trocar um filtro volta para a primeira página
+    if st.session_state.get("filtros_relatorio") != filtros:
+        st.session_state.filtros_relatorio = filtros
+        st.session_state.pagina_relatorio_atual = 1
+    pagina = st.session_state.setdefault("pagina_relatorio_atual", 1)
+
+    # Páginas compartilhadas entre as sessões (cache_dados); editar ou apagar
+    # contagens invalida todas
+    df_pagina, total = db.get_relatorio_contagens_pagina(
+        pagina - 1, por_pagina,
+        usuario_uid=usuario_uid, secao=secao, grupo=grupo)
+    if total == 0:
+        st.info("Nenhuma contagem registrada ainda." if filtros[:3] == (None, None, None)
+                else "Nenhuma contagem para os filtros escolhidos.")
+        return
+
+    total_paginas = (total + por_pagina - 1) // por_pagina
+    # Depois de apagar registros a página atual pode ter deixado de existir
+    if pagina > total_paginas:
+        st.session_state.pagina_relatorio_atual = total_paginas
+        st.rerun()
+    # Sem value=: o widget parte sempre da página guardada
+    st.session_state.pagina_relatorio = pagina
+    with col_p2:
+        st.number_input(f"Página (de {total_paginas})", min_value=1, max_value=total_paginas,
+                        key="pagina_relatorio", on_change=_mudar_pagina_relatorio)
+    inicio = (pagina - 1) * por_pagina
+    st.caption(f"Mostrando {inicio + 1}–{inicio + len(df_pagina)} de {total} contagem(ns).")
+
+    df_para_filtrar = df_pagina.assign(
+        usuario=df_pagina["usuario_uid"].map(user_map).fillna("Desconhecido"),
+        deletar=False)
 
     st.markdown("---")
 
@@ -290,21 +344,19 @@ def exibir_aba_relatorio():
     col_b1, col_b2 = st.columns(2)
     with col_b1:
         if st.button("💾 Salvar Alterações", use_container_width=True):
-            alteracoes_sucesso = 0
             # Extrair as mudanças diretamente do estado do data_editor para performance O(1) em vez de iterar tudo
             mudancas = st.session_state.get("data_editor_contagens", {}).get("edited_rows", {})
-            for idx_str, alteracoes in mudancas.items():
-                if "quantidade" in alteracoes:
-                    idx = int(idx_str)
-                    row_id = df_para_filtrar.iloc[idx]["id"]
-                    nova_qtd = alteracoes["quantidade"]
-                    if db.update_count(row_id, nova_qtd, admin=True):
-                        alteracoes_sucesso += 1
+            novas_quantidades = {
+                df_para_filtrar.iloc[int(idx_str)]["id"]: alteracoes["quantidade"]
+                for idx_str, alteracoes in mudancas.items()
+                if "quantidade" in alteracoes and alteracoes["quantidade"] is not None
+            }
+            # Todas as edições numa única chamada (ver sql/007)
+            alteracoes_sucesso = db.update_counts_bulk(novas_quantidades)["atualizados"]
 
             if alteracoes_sucesso > 0:
                 st.success(
                     f"{alteracoes_sucesso} contagem(ns) atualizada(s) com sucesso!")
-                del st.session_state.dados_contagem  # Força a recarga dos dados
                 st.rerun()
             else:
                 st.info("Nenhuma alteração de quantidade foi feita.")
@@ -313,11 +365,14 @@ def exibir_aba_relatorio():
         if st.button("🗑️ Deletar Registos Marcados", use_container_width=True):
             ids_para_deletar = edited_df[edited_df["deletar"]]["id"].tolist()
             if ids_para_deletar:
-                if db.delete_contagens_by_ids(ids_para_deletar):
+                apagados = db.delete_contagens_by_ids(ids_para_deletar)
+                if apagados == len(ids_para_deletar):
                     st.success(
-                        f"{len(ids_para_deletar)} registo(s) apagado(s) com sucesso.")
-                    del st.session_state.dados_contagem  # Força a recarga
+                        f"{apagados} registo(s) apagado(s) com sucesso.")
                     st.rerun()
+                elif apagados:
+                    st.warning(
+                        f"Apenas {apagados} de {len(ids_para_deletar)} registo(s) foram apagados.")
             else:
                 st.warning("Nenhum registo selecionado para apagar.")
 
@@ -330,15 +385,8 @@ def exibir_aba_relatorio():
 
         # Deletar por usuário
         st.subheader("Deletar todas as contagens de um usuário")
-        # 1. Pegamos apenas os usuários que REALMENTE fizeram contagens
-        usuarios_com_contagem = contagens.drop_duplicates(
-            subset=['usuario_uid'])
-
-        # 2. Criamos um dicionário para o selectbox: {Nome Amigável: UID}
-        mapa_nomes_para_uid = pd.Series(
-            usuarios_com_contagem.usuario_uid.values,
-            index=usuarios_com_contagem.usuario
-        ).to_dict()
+        # Apenas os usuários que REALMENTE fizeram contagens: {Nome Amigável: UID}
+        mapa_nomes_para_uid = nomes_para_uid
 
         if mapa_nomes_para_uid:
             # 3. As opções do selectbox são os nomes amigáveis
@@ -381,54 +429,39 @@ def exibir_aba_csv():
     st.subheader("📤 Atualizar Produtos a partir de Relatório")
     st.info("Faça o upload do relatório de cadastro do sistema. A aplicação fará a limpeza automaticamente.")
 
+    with st.expander("📦 Snapshot do catálogo atual (Parquet)"):
+        st.caption("Cópia do catálogo inteiro em formato colunar; pode ser enviada de volta aqui.")
+        if st.button("Gerar snapshot do catálogo"):
+            st.session_state.snapshot_catalogo = snapshots.exportar(db.get_all_produtos(), "parquet")
+        if "snapshot_catalogo" in st.session_state:
+            st.download_button(
+                label="📥 Descarregar catálogo (.parquet)",
+                data=st.session_state.pop("snapshot_catalogo"),
+                file_name="catalogo_produtos.parquet",
+                mime=snapshots.FORMATOS["parquet"]["mime"],
+            )
+
     arquivo = st.file_uploader(
-        "Selecione o relatório de cadastro do seu sistema", type=["csv"]
+        "Selecione o relatório de cadastro do seu sistema (ou um snapshot Parquet/Arrow)",
+        type=["csv", "parquet", "arrow"]
     )
     if not arquivo:
         return
 
     try:
-        # 1. Ler o relatório
-        df_bruto = pd.read_csv(arquivo, sep=";", encoding="latin1")
-
-        # 2. Validação de colunas
-        colunas_esperadas = {"Código", "Descrição", "EMB", "Quebra 2"}
-        if not colunas_esperadas.issubset(df_bruto.columns):
-            st.error(
-                f"Arquivo inválido. Esperado: {colunas_esperadas}, mas encontrou: {set(df_bruto.columns)}"
-            )
-            return
-
-        # 3. Extrair seção e grupo
-        coluna_de_dados = df_bruto["Quebra 2"].astype(str)
-        df_bruto["secao"] = coluna_de_dados.str.extract(
-            r"Seção: \d+ - (.*?)(?:Grupo:|$)"
-        )[0].str.strip()
-        df_bruto["grupo"] = coluna_de_dados.str.extract(
-            r"Grupo: \d+- (.*)"
-        )[0].str.strip()
-
-        # Corrigir valores nulos
-        df_bruto["grupo"] = df_bruto["grupo"].fillna("")
-        df_bruto["secao"] = df_bruto["secao"].ffill()
-        df_bruto["grupo"] = df_bruto["grupo"].ffill()
-
-        # 4. Limpeza e renomeação
-        df_bruto.dropna(subset=["Código"], inplace=True)
-        df_bruto.rename(
-            columns={"Código": "ean", "Descrição": "descricao", "EMB": "emb"},
-            inplace=True,
-        )
-
-        df = df_bruto[["ean", "descricao", "emb", "secao", "grupo"]].copy()
+        # 1. Ler o relatório em blocos (valida colunas, extrai seção/grupo e normaliza o EAN)
+        if snapshots.formato_do_conteudo(arquivo.getvalue()):
+            df = ingestao_csv.carregar_snapshot_produtos(arquivo)
+        else:
+            df = ingestao_csv.carregar_relatorio_cadastro(arquivo)
 
-        # 🔎 Normalização do EAN (mantém qualquer tamanho, apenas dígitos)
-        df["ean"] = (
-            df["ean"]
-            .astype(str)
-            .str.replace(r"\D", "", regex=True)  # mantém só números
-            .str.strip()
-        )
+        # Códigos com tamanho de EAN/GTIN mas dígito verificador errado não entram no banco
+        invalidos = db.ean_invalido_series(df["ean"])
+        if invalidos.any():
+            st.warning(
+                f"⚠️ {int(invalidos.sum())} linha(s) com EAN inválido (dígito verificador) foram ignoradas:")
+            st.dataframe(df[invalidos])
+            df = df[~invalidos].reset_index(drop=True)
 
         if df.empty:
             st.warning("Nenhum produto válido encontrado no arquivo.")
@@ -482,25 +515,42 @@ def exibir_aba_csv():
 
         if st.button("✅ Executar atualização", disabled=not tem_algo_para_fazer):
             if opcao.startswith("📦"):
-                db.atualizar_produtos_via_csv(diffs["novos"])
-                st.success(f"🟢 {qtd_novos} novos produtos inseridos!")
+                df_envio = diffs["novos"]
             elif opcao.startswith("🔁"):
-                df_div = diffs["divergentes"][
+                df_envio = diffs["divergentes"][
                     ["ean", "descricao_arquivo", "emb_arquivo",
                         "secao_arquivo", "grupo_arquivo"]
                 ].rename(columns=lambda col: col.replace("_arquivo", ""))
-                db.atualizar_produtos_via_csv(df_div)
-                st.success(f"🔁 {qtd_div} produtos divergentes atualizados!")
             elif opcao.startswith("📋"):
-                db.atualizar_produtos_via_csv(df)
-                st.success(
-                    f"📋 Banco atualizado com {qtd_total} produtos do relatório!")
+                df_envio = df
             else:
                 st.info("Nenhuma alteração foi feita no banco de dados.")
                 st.stop()
 
+            barra = st.progress(0.0, text="Enviando produtos...")
+            resultado = db.atualizar_produtos_via_csv(
+                df_envio,
+                progresso=lambda feitos, total: barra.progress(
+                    feitos / total, text=f"Enviando produtos... {feitos}/{total}")
+            )
+            barra.empty()
+            st.session_state.resultado_upsert = resultado
             st.rerun()
 
+        # Resultado do último envio (sobrevive ao st.rerun acima)
+        if "resultado_upsert" in st.session_state:
+            resultado = st.session_state.pop("resultado_upsert")
+            st.success(
+                f"🟢 {resultado['inseridos']} produto(s) inserido(s) e "
+                f"{resultado['atualizados']} atualizado(s), de {resultado['total']}.")
+            if resultado["falhas"]:
+                st.error(
+                    f"❌ {len(resultado['falhas'])} produto(s) não puderam ser gravados:")
+                st.dataframe(pd.DataFrame(resultado["falhas"]).rename(
+                    columns={"ean": "EAN", "erro": "Motivo"}), hide_index=True)
+
+    except KeyError as e:
+        st.error(f"❌ Arquivo inválido. {e}")
     except Exception as e:
         st.error(f"❌ Erro ao processar o arquivo: {e}")
         st.warning("Verifique se o arquivo é o relatório correto do sistema.")
@@ -602,49 +652,39 @@ def exibir_aba_auditoria():
         return
 
     try:
-        # Carregar e normalizar
-        df_sistema = db.carregar_relatorio_sistema(arquivo_sistema)
-        df_contado, n_linhas_contagens, n_unicos_contagens = db.carregar_contagens_consolidadas()
+        # Auditoria pronta por (conteúdo do arquivo, versão das contagens): trocar
+        # um filtro só fatia o quadro já calculado
+        conteudo = arquivo_sistema.getvalue()
+        auditoria = motor_auditoria.obter_auditoria(
+            conteudo,
+            db.versao_contagens(),
+            carregar_sistema=lambda: db.carregar_relatorio_sistema(conteudo),
+            carregar_contado=db.carregar_contagens_consolidadas,
+        )
 
         # Aviso sobre consolidação das contagens (se houver)
-        if n_linhas_contagens > n_unicos_contagens:
+        if auditoria.n_linhas_contagens > auditoria.n_unicos_contagens:
             st.info(
-                f"ℹ️ Consolidadas {n_linhas_contagens - n_unicos_contagens} linhas de contagem em {n_unicos_contagens} EANs únicos.")
-
-        # Merge (sistema é a base)
-        df_final = pd.merge(df_sistema, df_contado, on='ean', how='left')
-        df_final['estoque_contado'] = df_final['estoque_contado'].fillna(0)
-        df_final['estoque_sistema'] = pd.to_numeric(
-            df_final['estoque_sistema'], errors='coerce').fillna(0)
-        df_final['diferenca'] = df_final['estoque_contado'] - \
-            df_final['estoque_sistema']
+                f"ℹ️ Consolidadas {auditoria.n_linhas_contagens - auditoria.n_unicos_contagens} linhas de contagem em {auditoria.n_unicos_contagens} EANs únicos.")
 
-        df_final = df_final[['ean', 'descricao', 'secao', 'grupo',
-                             'estoque_sistema', 'estoque_contado', 'diferenca']]
-
-        if df_final.empty:
+        if len(auditoria) == 0:
             st.info("Não há produtos no relatório do sistema após o processamento.")
             return
 
         # --------------------------
         # Quadro resumo
         # --------------------------
-        total_produtos = len(df_final)
-        produtos_contados = (df_final['estoque_contado'] > 0).sum()
-        produtos_com_diferenca = (df_final['diferenca'] != 0).sum()
-        diferencas_positivas = (df_final['diferenca'] > 0).sum()
-        diferencas_negativas = (df_final['diferenca'] < 0).sum()
-        soma_diferencas = df_final['diferenca'].sum()
+        resumo = auditoria.resumo
 
         col_r1, col_r2, col_r3 = st.columns(3)
         col_r4, col_r5, col_r6 = st.columns(3)
 
-        col_r1.metric("📦 Total de Produtos", total_produtos)
-        col_r2.metric("✅ Produtos Contados", produtos_contados)
-        col_r3.metric("⚠️ Com Diferença", produtos_com_diferenca)
-        col_r4.metric("🔼 Diferenças Positivas", diferencas_positivas)
-        col_r5.metric("🔽 Diferenças Negativas", diferencas_negativas)
-        col_r6.metric("Σ Soma das Diferenças", soma_diferencas)
+        col_r1.metric("📦 Total de Produtos", resumo["total_produtos"])
+        col_r2.metric("✅ Produtos Contados", resumo["produtos_contados"])
+        col_r3.metric("⚠️ Com Diferença", resumo["produtos_com_diferenca"])
+        col_r4.metric("🔼 Diferenças Positivas", resumo["diferencas_positivas"])
+        col_r5.metric("🔽 Diferenças Negativas", resumo["diferencas_negativas"])
+        col_r6.metric("Σ Soma das Diferenças", resumo["soma_diferencas"])
 
         st.markdown("---")
         st.subheader("Relatório Comparativo")
@@ -652,97 +692,60 @@ def exibir_aba_auditoria():
         # --------------------------
         # Filtros: seção -> grupo -> tipo diferença -> apenas contados
         # --------------------------
-        # Preparar opções removendo vazios/NaN e ordenando
-        secoes = sorted([s for s in df_final['secao'].unique()
-                        if pd.notna(s) and str(s).strip() != ''])
-        secoes_options = ['Todas'] + secoes
-
         secao_selecionada = st.selectbox(
-            "Filtrar por Seção:", options=secoes_options)
-
-        if secao_selecionada != 'Todas':
-            df_filtrado = df_final[df_final['secao']
-                                   == secao_selecionada].copy()
-        else:
-            df_filtrado = df_final.copy()
+            "Filtrar por Seção:", options=['Todas'] + auditoria.secoes())
+        secao = None if secao_selecionada == 'Todas' else secao_selecionada
 
         # Grupo com base na seção atual (dinâmico)
-        grupos = sorted([g for g in df_filtrado['grupo'].unique()
-                        if pd.notna(g) and str(g).strip() != ''])
-        grupos_options = ['Todos'] + grupos
         grupo_selecionado = st.selectbox(
-            "Filtrar por Grupo:", options=grupos_options)
-
-        if grupo_selecionado != 'Todos':
-            df_filtrado = df_filtrado[df_filtrado['grupo']
-                                      == grupo_selecionado].copy()
+            "Filtrar por Grupo:", options=['Todos'] + auditoria.grupos(secao))
+        grupo = None if grupo_selecionado == 'Todos' else grupo_selecionado
 
         # Tipo de diferença (radio)
         col1, col2 = st.columns([2, 1])
         with col1:
             tipo_de_diferenca = st.radio(
                 "Filtrar por tipo de diferença:",
-                options=["Mostrar Todos", "Apenas com Diferença",
-                         "Diferença Positiva", "Diferença Negativa", "Sem Diferença (Zerados)"],
+                options=motor_auditoria.TIPOS_DIFERENCA,
                 horizontal=True
             )
 
-        if tipo_de_diferenca == "Apenas com Diferença":
-            df_filtrado = df_filtrado[df_filtrado['diferenca'] != 0]
-        elif tipo_de_diferenca == "Diferença Positiva":
-            df_filtrado = df_filtrado[df_filtrado['diferenca'] > 0]
-        elif tipo_de_diferenca == "Diferença Negativa":
-            df_filtrado = df_filtrado[df_filtrado['diferenca'] < 0]
-        elif tipo_de_diferenca == "Sem Diferença (Zerados)":
-            df_filtrado = df_filtrado[df_filtrado['diferenca'] == 0]
-
         with col2:
             mostrar_apenas_contados = st.checkbox(
                 "Mostrar apenas produtos contados")
-            if mostrar_apenas_contados:
-                df_filtrado = df_filtrado[df_filtrado['estoque_contado'] != 0]
 
-        # --------------------------
-        # Ordenar A → Z pela descricao (case-insensitive)
-        # --------------------------
-        df_display = df_filtrado.sort_values(
-            by='descricao', key=lambda s: s.str.lower()).reset_index(drop=True)
-
-        # --------------------------
-        # Formatação apenas para exibição (não altera df_display usado para CSV)
-        # --------------------------
-        def formatar_numero(valor):
-            import math
-            if pd.isna(valor):
-                return ""
-            try:
-                f = float(valor)
-                if math.isclose(f, int(f)):
-                    return str(int(round(f)))
-                # trocar ponto por vírgula para exibição
-                return str(f).replace('.', ',')
-            except Exception:
-                return str(valor)
-
-        df_display_fmt = df_display.copy()
-        for col in ['estoque_sistema', 'estoque_contado', 'diferenca']:
-            if col in df_display_fmt.columns:
-                df_display_fmt[col] = df_display_fmt[col].apply(
-                    formatar_numero)
-
-        st.dataframe(df_display_fmt, use_container_width=True, hide_index=True)
+        # Já ordenado A → Z pela descrição e com os números formatados
+        posicoes = auditoria.filtrar(secao, grupo, tipo_de_diferenca, mostrar_apenas_contados)
+        st.dataframe(auditoria.exibicao(posicoes), use_container_width=True, hide_index=True)
+        df_display = auditoria.dados(posicoes)
 
         # --------------------------
         # Download (CSV) - usa os valores numéricos originais
         # --------------------------
-        csv = df_display.to_csv(index=False, sep=';',
-                                encoding='latin1').encode('latin1')
+        formato = st.radio("Formato do arquivo:", ["CSV", "Parquet", "Arrow"], horizontal=True,
+                           help="Parquet/Arrow: arquivos menores e leitura imediata no pandas/Excel Power Query.")
+        if formato == "CSV":
+            dados = df_display.to_csv(index=False, sep=';',
+                                      encoding='latin1').encode('latin1')
+            extensao, mime = "csv", "text/csv"
+        else:
+            chave = formato.lower()
+            dados = snapshots.exportar(df_display, chave)
+            extensao, mime = snapshots.FORMATOS[chave]["extensao"], snapshots.FORMATOS[chave]["mime"]
         st.download_button(
             label="📥 Descarregar Relatório de Auditoria",
-            data=csv,
-            file_name='auditoria_de_estoque.csv',
-            mime='text/csv',
+            data=dados,
+            file_name=f'auditoria_de_estoque.{extensao}',
+            mime=mime,
         )
+        if formato != "CSV":
+            df_contado, _, _ = db.carregar_contagens_consolidadas()
+            st.download_button(
+                label="📥 Descarregar Contagens Consolidadas",
+                data=snapshots.exportar(df_contado, formato.lower()),
+                file_name=f'contagens_consolidadas.{extensao}',
+                mime=mime,
+            )
 
     except KeyError as e:
         st.error(f"❌ Coluna ausente no relatório: {e}")
@@ -2,6 +2,8 @@ import streamlit as st
 import pandas as pd
 import database_api as db
 from modules.scanner import get_barcode, get_barcode_from_image
+from modules.contagem_lote import (OPCAO_VARIOS_CODIGOS, exibir_leitura_varios,
+                                   exibir_lancamento_em_lote)
 
 
 def fazer_logout():
@@ -34,7 +36,8 @@ def show_user_page(username, user_uid):
     st.markdown("### 🧾 Identificar produto")
 
     tipo_leitura = st.radio("Escolha o método de leitura da câmera:", 
-                            ["📹 Leitor ao Vivo (Android/PC)", "📸 Tirar Foto (Ideal para iPhone)"], 
+                            ["📹 Leitor ao Vivo (Android/PC)", "📸 Tirar Foto (Ideal para iPhone)",
+                             OPCAO_VARIOS_CODIGOS], 
                             horizontal=True)
 
     if st.button("📷 Ativar Câmera / Leitor"):
@@ -43,7 +46,9 @@ def show_user_page(username, user_uid):
     # O scanner só é mostrado se o estado for ativo
     if st.session_state.get("scanner_active", False):
         ean_lido = None
-        if "Tirar Foto" in tipo_leitura:
+        if tipo_leitura == OPCAO_VARIOS_CODIGOS:
+            exibir_leitura_varios(user_uid)
+        elif "Tirar Foto" in tipo_leitura:
             st.info("Tire uma foto bem nítida e focada do código de barras.")
             foto = st.camera_input("Foto do Código")
             if foto:
@@ -80,7 +85,10 @@ def show_user_page(username, user_uid):
         ean = ean.strip()
         ean = db.sanitizar_ean(ean)
         produto = db.get_product_info(ean)
-        if produto:
+        if db.ean_invalido(ean):
+            # Leitura errada ou erro de digitação: não oferece o cadastro
+            st.error("❌ Código inválido (dígito verificador não confere). Leia ou digite novamente.")
+        elif produto:
             st.success(f"🟢 Produto encontrado: **{produto['descricao']}**")
         else:
             # Se o produto NÃO EXISTE, mostramos o formulário de cadastro
@@ -131,13 +139,16 @@ def show_user_page(username, user_uid):
             contar = st.form_submit_button("Registrar")
             if contar:
                 try:
-                    db.add_or_update_count(user_uid, ean, quantidade)
+                    # Usa o EAN como está gravado (UPC-A pode estar com 12 ou 13 dígitos)
+                    db.add_or_update_count(user_uid, produto["ean"], quantidade)
                     st.session_state.count_message = f"📊 Contagem de {quantidade} para '{produto['descricao']}' registrada!"
                     st.session_state.count_successful = True
                     st.rerun()
                 except Exception as e:
                     st.error(f"Erro ao registrar contagem: {e}")
     
+    exibir_lancamento_em_lote(user_uid)
+
     with st.expander("Ver minhas contagens registadas"):
         # 1. Chamamos a nossa nova função, passando o UID do utilizador logado
         minhas_contagens = db.get_contagens_por_usuario(user_uid)
@@ -16,74 +16,372 @@ def get_barcode():
     return None
 
 import cv2
+import hashlib
+import io
 import numpy as np
+import os
+import threading
+from cachetools import LRUCache
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+
+# --- Estratégias de pré-processamento ---
+# Cada uma recebe a imagem original (PIL), o array RGB e o array em tons de
+# cinza, e devolve a imagem que será entregue ao zbar.
+def _original(img, img_array, gray):
+    return img
+
+
+def _cinza(img, img_array, gray):
+    return gray
+
+
+def _equalizada(img, img_array, gray):
+    # Melhora muito o contraste em fotos escuras como as de webcams
+    return cv2.equalizeHist(gray)
+
+
+def _nitidez(img, img_array, gray):
+    # Filtro de nitidez (sharpening) para focar as barras
+    kernel_sharpening = np.array([[-1, -1, -1], [-1, 9, -1], [-1, -1, -1]])
+    return cv2.filter2D(gray, -1, kernel_sharpening)
+
+
+def _limiar_otsu(img, img_array, gray):
+    # Útil para fotos com sombras ou iluminação desigual
+    blurred = cv2.GaussianBlur(gray, (5, 5), 0)
+    _, thresh = cv2.threshold(blurred, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    return thresh
+
+
+def _reduzida(img, img_array, gray):
+    # Fotos de celular às vezes são grandes demais
+    width = int(gray.shape[1] * 50 / 100)
+    height = int(gray.shape[0] * 50 / 100)
+    return cv2.resize(gray, (width, height), interpolation=cv2.INTER_AREA)
+
+
+def _ampliada(img, img_array, gray):
+    # Fotos de PC às vezes são pequenas/borradas
+    width_up = int(gray.shape[1] * 150 / 100)
+    height_up = int(gray.shape[0] * 150 / 100)
+    return cv2.resize(gray, (width_up, height_up), interpolation=cv2.INTER_CUBIC)
+
+
+# A ordem aqui é a ordem inicial; depois passa a valer a estatística de acertos
+ESTRATEGIAS = {
+    "original": _original,
+    "cinza": _cinza,
+    "equalizada": _equalizada,
+    "nitidez": _nitidez,
+    "limiar_otsu": _limiar_otsu,
+    "reduzida": _reduzida,
+    "ampliada": _ampliada,
+}
+
+# OpenCV e zbar liberam o GIL, então as estratégias rodam de fato em paralelo
+_executor = ThreadPoolExecutor(
+    max_workers=min(len(ESTRATEGIAS), os.cpu_count() or 2),
+    thread_name_prefix="decodificador"
+)
+
+# Quantas vezes cada estratégia foi a primeira a ler o código neste processo
+_acertos = Counter()
+_lock_acertos = threading.Lock()
+
+
+def ordem_estrategias():
+    """Estratégias que mais acertaram nesta instalação vão primeiro para a fila."""
+    with _lock_acertos:
+        acertos = dict(_acertos)
+    nomes = list(ESTRATEGIAS)
+    return sorted(nomes, key=lambda nome: (-acertos.get(nome, 0), nomes.index(nome)))
+
+
+def _registrar_acerto(nome):
+    with _lock_acertos:
+        _acertos[nome] += 1
+
+
+def _tentar_estrategia(nome, img, img_array, gray, encontrado):
+    # Se outra estratégia já leu o código, nem começa (ou não chama o zbar)
+    if encontrado.is_set():
+        return None
+    imagem = ESTRATEGIAS[nome](img, img_array, gray)
+    if encontrado.is_set():
+        return None
+    decoded_objects = decode(imagem)
+    if decoded_objects:
+        return str(decoded_objects[0].data.decode('utf-8'))
+    return None
+
+
+# --- Localização das regiões com código de barras ---
+LADO_MAXIMO_DETECCAO = 1000  # a busca roda numa cópia reduzida; o recorte sai da original
+MAX_REGIOES = 5
+
+
+def _regioes_cv2_barcode(pequena):
+    """Caixas (x, y, w, h) devolvidas pelo detector do OpenCV (cv2.barcode)."""
+    ok, pontos = cv2.barcode.BarcodeDetector().detect(pequena)
+    if not ok or pontos is None:
+        return []
+    return [cv2.boundingRect(p.astype(np.int32)) for p in pontos]
+
+
+def _regioes_gradiente(pequena, max_regioes: int = MAX_REGIOES):
+    """
+    Caixas por gradiente + morfologia: barras verticais geram muito gradiente
+    horizontal e pouco vertical; fechando essa região sobra um retângulo.
+    """
+    grad_x = cv2.Sobel(pequena, cv2.CV_32F, 1, 0, ksize=-1)
+    grad_y = cv2.Sobel(pequena, cv2.CV_32F, 0, 1, ksize=-1)
+    gradiente = cv2.convertScaleAbs(cv2.subtract(grad_x, grad_y))
+    gradiente = cv2.blur(gradiente, (9, 9))
+    _, mascara = cv2.threshold(gradiente, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (21, 7))
+    mascara = cv2.morphologyEx(mascara, cv2.MORPH_CLOSE, kernel)
+    mascara = cv2.erode(mascara, None, iterations=4)
+    mascara = cv2.dilate(mascara, None, iterations=4)
+    contornos, _ = cv2.findContours(mascara, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    contornos = sorted(contornos, key=cv2.contourArea, reverse=True)[:max_regioes]
+    return [cv2.boundingRect(c) for c in contornos]
+
+
+def caixas_regioes(gray, max_regioes: int = MAX_REGIOES):
+    """
+    Caixas (x0, y0, x1, y1), em coordenadas da imagem original e já com margem,
+    das regiões que parecem ter um código de barras. Usa cv2.barcode quando o
+    OpenCV tem o módulo e cai no método de gradiente quando não tem ou quando
+    ele não acha nada.
+    """
+    altura, largura = gray.shape[:2]
+    escala = min(1.0, LADO_MAXIMO_DETECCAO / max(altura, largura))
+    pequena = gray if escala == 1.0 else cv2.resize(
+        gray, (int(largura * escala), int(altura * escala)), interpolation=cv2.INTER_AREA)
+
+    caixas = []
+    if hasattr(cv2, "barcode"):
+        try:
+            caixas = _regioes_cv2_barcode(pequena)
+        except cv2.error:
+            caixas = []
+    if not caixas:
+        caixas = _regioes_gradiente(pequena, max_regioes)
+
+    resultado = []
+    for x, y, w, h in caixas[:max_regioes]:
+        if w < 10 or h < 5:
+            continue
+        # Volta para a escala original com margem: o zbar precisa da zona branca lateral
+        margem_x, margem_y = int(w * 0.15) + 5, int(h * 0.25) + 5
+        x0 = max(0, int((x - margem_x) / escala))
+        y0 = max(0, int((y - margem_y) / escala))
+        x1 = min(largura, int((x + w + margem_x) / escala))
+        y1 = min(altura, int((y + h + margem_y) / escala))
+        resultado.append((x0, y0, x1, y1))
+    return resultado
+
+
+def localizar_regioes(gray, max_regioes: int = MAX_REGIOES):
+    """Recortes (em resolução original) das regiões candidatas."""
+    return [gray[y0:y1, x0:x1] for x0, y0, x1, y1 in caixas_regioes(gray, max_regioes)]
+
+
+def _ler_regioes(gray):
+    """Tenta o zbar só nos recortes localizados; devolve o primeiro código lido."""
+    for recorte in localizar_regioes(gray):
+        decoded_objects = decode(recorte)
+        if decoded_objects:
+            return str(decoded_objects[0].data.decode('utf-8'))
+    return None
+
+
+# --- Cache das leituras ---
+# O Streamlit reexecuta o script a cada interação e entrega a mesma foto do
+# st.camera_input de novo; a leitura (ou a falta dela) fica guardada pelo hash
+# do conteúdo do arquivo.
+TAMANHO_CACHE_LEITURAS = 256
+_SEM_CODIGO = object()  # leitura já feita que não achou código (cache negativo)
+_cache_leituras = LRUCache(maxsize=TAMANHO_CACHE_LEITURAS)
+_lock_cache_leituras = threading.Lock()
+
+
+def _bytes_da_imagem(image_file) -> bytes:
+    """Conteúdo do arquivo (UploadedFile, BytesIO, caminho ou bytes)."""
+    if isinstance(image_file, (bytes, bytearray)):
+        return bytes(image_file)
+    if isinstance(image_file, (str, os.PathLike)):
+        with open(image_file, "rb") as f:
+            return f.read()
+    if hasattr(image_file, "getvalue"):
+        return image_file.getvalue()
+    posicao = image_file.tell()
+    dados = image_file.read()
+    image_file.seek(posicao)
+    return dados
+
+
+def _chave_imagem(dados: bytes) -> str:
+    # blake2b é bem mais rápido que decodificar e tem colisão desprezível aqui
+    return hashlib.blake2b(dados, digest_size=16).hexdigest()
+
+
+def limpar_cache_leituras():
+    with _lock_cache_leituras:
+        _cache_leituras.clear()
+
 
 def get_barcode_from_image(image_file):
     """
     Lê um código de barras a partir de um arquivo de imagem.
-    Aplica técnicas de visão computacional (OpenCV) para melhorar a leitura.
+    Aplica técnicas de visão computacional (OpenCV) para melhorar a leitura:
+    primeiro tenta só as regiões onde há um código; depois, se preciso, a
+    imagem inteira com as estratégias em paralelo (vale a primeira leitura).
+    A mesma foto enviada de novo devolve o resultado guardado sem reprocessar.
     """
+    try:
+        dados = _bytes_da_imagem(image_file)
+    except Exception as e:
+        print(f"Erro ao processar a imagem do código de barras: {e}")
+        return None
+
+    chave = _chave_imagem(dados)
+    with _lock_cache_leituras:
+        guardado = _cache_leituras.get(chave)
+    if guardado is not None:
+        return None if guardado is _SEM_CODIGO else guardado
+
+    codigo, concluida = _decodificar(dados)
+    # Erro no processamento não é guardado: pode ser algo passageiro
+    if concluida:
+        with _lock_cache_leituras:
+            _cache_leituras[chave] = codigo if codigo else _SEM_CODIGO
+    return codigo
+
+
+def _decodificar(dados: bytes):
+    """Roda o pipeline completo; devolve (código ou None, se a leitura terminou sem erro)."""
     try:
         # Abrir imagem com Pillow e converter para array do Numpy
-        img = Image.open(image_file)
-        
+        img = Image.open(io.BytesIO(dados))
+
         # Garantir que a imagem esteja em modo RGB (Pillow pode abrir como RGBA)
         if img.mode != 'RGB':
             img = img.convert('RGB')
-            
+
         img_array = np.array(img)
-        
-        # 1. Tentar ler a imagem original primeiro
-        decoded_objects = decode(img)
-        if decoded_objects:
-            return str(decoded_objects[0].data.decode('utf-8'))
-            
-        # 2. Se falhar, converter para Tons de Cinza (Grayscale)
         gray = cv2.cvtColor(img_array, cv2.COLOR_RGB2GRAY)
-        decoded_objects = decode(gray)
-        if decoded_objects:
-            return str(decoded_objects[0].data.decode('utf-8'))
-            
-        # 3. Aplicar equalização de histograma (melhora muito o contraste em fotos escuras como de webcams)
-        equalized = cv2.equalizeHist(gray)
-        decoded_objects = decode(equalized)
-        if decoded_objects:
-            return str(decoded_objects[0].data.decode('utf-8'))
-            
-        # 4. Aplicar Filtro de Nitidez (Sharpening) para focar as barras
-        kernel_sharpening = np.array([[-1,-1,-1], [-1, 9,-1], [-1,-1,-1]])
-        sharpened = cv2.filter2D(gray, -1, kernel_sharpening)
-        decoded_objects = decode(sharpened)
-        if decoded_objects:
-            return str(decoded_objects[0].data.decode('utf-8'))
 
-        # 5. Aplicar limiarização (Thresholding) para aumentar o contraste do preto/branco
-        # Útil para fotos com sombras ou iluminação desigual
-        blurred = cv2.GaussianBlur(gray, (5, 5), 0)
-        _, thresh = cv2.threshold(blurred, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-        decoded_objects = decode(thresh)
-        if decoded_objects:
-            return str(decoded_objects[0].data.decode('utf-8'))
-            
-        # 6. Tentar redimensionar a imagem (fotos de celular às vezes são grandes demais)
-        scale_percent = 50 # reduz pela metade
-        width = int(gray.shape[1] * scale_percent / 100)
-        height = int(gray.shape[0] * scale_percent / 100)
-        resized = cv2.resize(gray, (width, height), interpolation = cv2.INTER_AREA)
-        decoded_objects = decode(resized)
-        if decoded_objects:
-            return str(decoded_objects[0].data.decode('utf-8'))
-            
-        # 7. Tentar redimensionar aumentando a imagem (fotos de PC às vezes são pequenas/borradas)
-        scale_up = 150
-        width_up = int(gray.shape[1] * scale_up / 100)
-        height_up = int(gray.shape[0] * scale_up / 100)
-        resized_up = cv2.resize(gray, (width_up, height_up), interpolation = cv2.INTER_CUBIC)
-        decoded_objects = decode(resized_up)
-        if decoded_objects:
-            return str(decoded_objects[0].data.decode('utf-8'))
+        # 1. Primeiro só as regiões candidatas: recortes pequenos decodificam rápido
+        codigo = _ler_regioes(gray)
+        if codigo:
+            _registrar_acerto("regioes")
+            return codigo, True
 
-        return None
+        # 2. Se nenhuma região deu leitura, a imagem inteira com todas as estratégias
+        encontrado = threading.Event()
+        futuros = {
+            _executor.submit(_tentar_estrategia, nome, img, img_array, gray, encontrado): nome
+            for nome in ordem_estrategias()
+        }
+        try:
+            for futuro in as_completed(futuros):
+                codigo = futuro.result()
+                if codigo:
+                    encontrado.set()
+                    _registrar_acerto(futuros[futuro])
+                    return codigo, True
+        finally:
+            # Cancela o que ainda está na fila; as que já rodam param no próximo ponto de checagem
+            encontrado.set()
+            for futuro in futuros:
+                futuro.cancel()
+
+        return None, True
     except Exception as e:
         print(f"Erro ao processar a imagem do código de barras: {e}")
-        return None
+        return None, False
+
+
+# --- Vários códigos numa foto (prateleira, folha de etiquetas) ---
+MAX_REGIOES_VARIOS = 40
+# Só estratégias que mantêm a geometria da original: as caixas valem para a foto
+ESTRATEGIAS_VARIOS = ("original", "cinza", "equalizada", "limiar_otsu")
+
+
+def _ler_todos(imagem, dx: int = 0, dy: int = 0):
+    """Todos os códigos da imagem como (código, (x, y, w, h)) na foto original."""
+    lidos = []
+    for obj in decode(imagem):
+        r = obj.rect
+        lidos.append((str(obj.data.decode('utf-8')), (r.left + dx, r.top + dy, r.width, r.height)))
+    return lidos
+
+
+def _decodificar_varios(dados: bytes):
+    """Roda imagem inteira e recortes em paralelo e junta tudo; devolve (lista, terminou sem erro)."""
+    try:
+        img = Image.open(io.BytesIO(dados))
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        img_array = np.array(img)
+        gray = cv2.cvtColor(img_array, cv2.COLOR_RGB2GRAY)
+
+        futuros = [
+            _executor.submit(lambda nome=nome: _ler_todos(ESTRATEGIAS[nome](img, img_array, gray)))
+            for nome in ESTRATEGIAS_VARIOS
+        ]
+        # Cada recorte pode ter um código que a imagem inteira (pequeno demais) não mostra
+        futuros += [
+            _executor.submit(_ler_todos, gray[y0:y1, x0:x1], x0, y0)
+            for x0, y0, x1, y1 in caixas_regioes(gray, MAX_REGIOES_VARIOS)
+        ]
+
+        caixas = {}
+        for futuro in as_completed(futuros):
+            for codigo, caixa in futuro.result():
+                caixas.setdefault(codigo, caixa)
+        # Ordem de leitura: de cima para baixo, da esquerda para a direita
+        codigos = sorted(caixas, key=lambda c: (caixas[c][1], caixas[c][0]))
+        return [{"ean": codigo, "bbox": caixas[codigo]} for codigo in codigos], True
+    except Exception as e:
+        print(f"Erro ao processar a imagem dos códigos de barras: {e}")
+        return [], False
+
+
+def get_barcodes_from_image(image_file):
+    """
+    Lê todos os códigos de barras distintos de uma foto.
+    Retorna uma lista de dicts {"ean": código lido, "bbox": (x, y, largura, altura)}
+    na ordem em que aparecem na foto; lista vazia se nada foi lido.
+    """
+    try:
+        dados = _bytes_da_imagem(image_file)
+    except Exception as e:
+        print(f"Erro ao processar a imagem dos códigos de barras: {e}")
+        return []
+
+    chave = ("varios", _chave_imagem(dados))
+    with _lock_cache_leituras:
+        guardado = _cache_leituras.get(chave)
+    if guardado is not None:
+        return [dict(item) for item in guardado]
+
+    lidos, concluida = _decodificar_varios(dados)
+    if concluida:
+        with _lock_cache_leituras:
+            _cache_leituras[chave] = tuple(lidos)
+    return [dict(item) for item in lidos]
+
+
+def desenhar_caixas(image_file, lidos):
+    """Cópia RGB da foto com a caixa e o código de cada leitura, para conferência."""
+    img = np.array(Image.open(io.BytesIO(_bytes_da_imagem(image_file))).convert('RGB'))
+    for item in lidos:
+        x, y, w, h = item["bbox"]
+        cv2.rectangle(img, (x, y), (x + w, y + h), (0, 200, 0), 3)
+        cv2.putText(img, item["ean"], (x, max(15, y - 8)),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 120, 0), 2)
+    return img
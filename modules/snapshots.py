@@ -0,0 +1,63 @@
+import io
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+
+# Colunas com poucos valores distintos repetidos em milhares de linhas:
+# gravadas como dicionário (cada texto uma vez só + índices inteiros)
+COLUNAS_DICIONARIO = ("secao", "grupo", "emb")
+
+FORMATOS = {
+    "parquet": {"extensao": "parquet", "mime": "application/vnd.apache.parquet"},
+    "arrow": {"extensao": "arrow", "mime": "application/vnd.apache.arrow.file"},
+}
+
+
+def _tabela(df: pd.DataFrame) -> pa.Table:
+    tabela = pa.Table.from_pandas(df, preserve_index=False)
+    for i, campo in enumerate(tabela.schema):
+        if campo.name in COLUNAS_DICIONARIO and pa.types.is_string(campo.type):
+            tabela = tabela.set_column(i, campo.name, tabela.column(i).dictionary_encode())
+    return tabela
+
+
+def exportar(df: pd.DataFrame, formato: str = "parquet") -> bytes:
+    """Snapshot do DataFrame em Parquet (zstd) ou Arrow IPC (arquivo, lz4)."""
+    tabela = _tabela(df)
+    buffer = io.BytesIO()
+    if formato == "parquet":
+        pq.write_table(tabela, buffer, compression="zstd")
+    elif formato == "arrow":
+        feather.write_feather(tabela, buffer, compression="lz4")
+    else:
+        raise ValueError(f"Formato de snapshot desconhecido: {formato}")
+    return buffer.getvalue()
+
+
+def formato_do_conteudo(conteudo: bytes):
+    """'parquet', 'arrow' ou None, pela assinatura no início do arquivo."""
+    if conteudo[:4] == b"PAR1":
+        return "parquet"
+    if conteudo[:6] == b"ARROW1":
+        return "arrow"
+    return None
+
+
+def importar(arquivo) -> pd.DataFrame:
+    """
+    Lê um snapshot (bytes ou arquivo enviado) em Parquet ou Arrow IPC.
+    As colunas de dicionário voltam como texto comum, como nas leituras do banco.
+    """
+    conteudo = arquivo if isinstance(arquivo, bytes) else arquivo.getvalue()
+    formato = formato_do_conteudo(conteudo)
+    if formato == "parquet":
+        tabela = pq.read_table(io.BytesIO(conteudo))
+    elif formato == "arrow":
+        tabela = feather.read_table(io.BytesIO(conteudo))
+    else:
+        raise ValueError("O arquivo não é um snapshot Parquet nem Arrow.")
+    for i, campo in enumerate(tabela.schema):
+        if pa.types.is_dictionary(campo.type):
+            tabela = tabela.set_column(i, campo.name, tabela.column(i).cast(campo.type.value_type))
+    return tabela.to_pandas()
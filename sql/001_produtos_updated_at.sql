@@ -0,0 +1,23 @@
+-- Marca de alteração do catálogo.
+-- O índice pré-carregado (PRELOAD_PRODUTOS) compara max(updated_at) + total de
+-- linhas para saber quando precisa recarregar a tabela produtos.
+
+alter table produtos
+    add column if not exists updated_at timestamptz not null default now();
+
+create index if not exists produtos_updated_at_idx on produtos (updated_at);
+
+create or replace function produtos_touch_updated_at()
+returns trigger
+language plpgsql
+as $$
+begin
+    new.updated_at := now();
+    return new;
+end;
+$$;
+
+drop trigger if exists trg_produtos_updated_at on produtos;
+create trigger trg_produtos_updated_at
+    before insert or update on produtos
+    for each row execute function produtos_touch_updated_at();
@@ -0,0 +1,55 @@
+-- Incremento atômico de contagem em uma única ida ao banco.
+-- Substitui o SELECT + UPDATE/INSERT de add_or_update_count, que perdia
+-- atualizações quando duas sessões do mesmo usuário contavam o mesmo EAN.
+--
+-- Para testar num Postgres local:
+--   psql -d inventario -f sql/002_incrementar_contagem.sql
+--   select incrementar_contagem('00000000-0000-0000-0000-000000000001', '7891234567895', 2);
+--   select incrementar_contagem('00000000-0000-0000-0000-000000000001', '7891234567895', 3);
+--   -- quantidade = 5, uma única linha
+
+-- O ON CONFLICT precisa de uma restrição única; antes disso juntamos
+-- eventuais linhas duplicadas que a versão antiga possa ter criado.
+with duplicadas as (
+    select usuario_uid, ean, min(id) as manter, sum(quantidade) as total
+    from contagens
+    group by usuario_uid, ean
+    having count(*) > 1
+), somadas as (
+    update contagens c
+    set quantidade = d.total
+    from duplicadas d
+    where c.id = d.manter
+)
+delete from contagens c
+using duplicadas d
+where c.usuario_uid = d.usuario_uid
+  and c.ean = d.ean
+  and c.id <> d.manter;
+
+do $$
+begin
+    if not exists (
+        select 1 from pg_constraint where conname = 'contagens_usuario_ean_key'
+    ) then
+        alter table contagens
+            add constraint contagens_usuario_ean_key unique (usuario_uid, ean);
+    end if;
+end;
+$$;
+
+create or replace function incrementar_contagem(
+    p_usuario_uid uuid,
+    p_ean text,
+    p_quantidade numeric
+)
+returns numeric
+language sql
+as $$
+    insert into contagens (usuario_uid, ean, quantidade)
+    values (p_usuario_uid, p_ean, p_quantidade)
+    on conflict (usuario_uid, ean) do update
+        set quantidade = contagens.quantidade + excluded.quantidade,
+            last_updated_at = now()
+    returning quantidade;
+$$;
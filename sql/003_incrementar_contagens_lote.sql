@@ -0,0 +1,31 @@
+-- Incremento de várias contagens numa única chamada (usado pela fila
+-- write-behind de add_or_update_count). Depende da restrição única de sql/002.
+--
+-- p_itens: [{"usuario_uid": "...", "ean": "...", "quantidade": 1.5}, ...]
+--
+--   select incrementar_contagens_lote('[
+--     {"usuario_uid": "00000000-0000-0000-0000-000000000001", "ean": "7891234567895", "quantidade": 2},
+--     {"usuario_uid": "00000000-0000-0000-0000-000000000001", "ean": "7891234567895", "quantidade": 1}
+--   ]'::jsonb);
+
+create or replace function incrementar_contagens_lote(p_itens jsonb)
+returns integer
+language sql
+as $$
+    with itens as (
+        -- ON CONFLICT não aceita tocar a mesma linha duas vezes no mesmo comando
+        select (i ->> 'usuario_uid')::uuid as usuario_uid,
+               i ->> 'ean' as ean,
+               sum((i ->> 'quantidade')::numeric) as quantidade
+        from jsonb_array_elements(p_itens) as i
+        group by 1, 2
+    ), gravados as (
+        insert into contagens (usuario_uid, ean, quantidade)
+        select usuario_uid, ean, quantidade from itens
+        on conflict (usuario_uid, ean) do update
+            set quantidade = contagens.quantidade + excluded.quantidade,
+                last_updated_at = now()
+        returning 1
+    )
+    select count(*)::integer from gravados;
+$$;
@@ -0,0 +1,77 @@
+-- Sincronização das contagens feitas em modo offline.
+-- Cada aparelho envia, por (usuario_uid, ean), o total acumulado localmente e
+-- um número de versão que só cresce. O banco guarda o que já aplicou de cada
+-- aparelho e soma em contagens apenas a diferença, então reenviar o mesmo lote
+-- (ex.: resposta perdida) não conta nada em dobro. Depende de sql/002.
+--
+--   select sincronizar_contagens('aparelho-1', '[
+--     {"usuario_uid": "00000000-0000-0000-0000-000000000001",
+--      "ean": "7891234567895", "total": 5, "versao": 3}
+--   ]'::jsonb);
+
+create table if not exists contagens_sync (
+    dispositivo text not null,
+    usuario_uid uuid not null,
+    ean text not null,
+    versao integer not null,
+    total_aplicado numeric not null,
+    sincronizado_em timestamptz not null default now(),
+    primary key (dispositivo, usuario_uid, ean)
+);
+
+create or replace function sincronizar_contagens(p_dispositivo text, p_itens jsonb)
+returns jsonb
+language plpgsql
+as $$
+declare
+    item jsonb;
+    v_uid uuid;
+    v_ean text;
+    v_total numeric;
+    v_versao integer;
+    v_registro contagens_sync%rowtype;
+    v_status text;
+    v_resultado jsonb := '[]'::jsonb;
+begin
+    for item in select * from jsonb_array_elements(p_itens) loop
+        v_uid := (item ->> 'usuario_uid')::uuid;
+        v_ean := item ->> 'ean';
+        v_total := (item ->> 'total')::numeric;
+        v_versao := (item ->> 'versao')::integer;
+
+        select * into v_registro
+        from contagens_sync
+        where dispositivo = p_dispositivo and usuario_uid = v_uid and ean = v_ean
+        for update;
+
+        if found and v_registro.versao = v_versao then
+            v_status := 'duplicado';
+        elsif found and (v_registro.versao > v_versao or v_registro.total_aplicado > v_total) then
+            -- O aparelho "voltou no tempo" (banco local restaurado/apagado)
+            v_status := 'conflito';
+        else
+            insert into contagens (usuario_uid, ean, quantidade)
+            values (v_uid, v_ean, v_total - coalesce(v_registro.total_aplicado, 0))
+            on conflict (usuario_uid, ean) do update
+                set quantidade = contagens.quantidade + excluded.quantidade,
+                    last_updated_at = now();
+
+            insert into contagens_sync (dispositivo, usuario_uid, ean, versao, total_aplicado)
+            values (p_dispositivo, v_uid, v_ean, v_versao, v_total)
+            on conflict (dispositivo, usuario_uid, ean) do update
+                set versao = excluded.versao,
+                    total_aplicado = excluded.total_aplicado,
+                    sincronizado_em = now();
+            v_status := 'aplicado';
+        end if;
+
+        v_resultado := v_resultado || jsonb_build_object(
+            'usuario_uid', v_uid, 'ean', v_ean, 'versao', v_versao,
+            'status', v_status,
+            'versao_banco', coalesce(v_registro.versao, 0),
+            'total_banco', coalesce(v_registro.total_aplicado, 0));
+        v_registro := null;
+    end loop;
+    return v_resultado;
+end;
+$$;
@@ -0,0 +1,16 @@
+-- Hash do conteúdo de cada produto, usado por comparar_produtos_com_banco
+-- para achar divergências sem baixar o catálogo inteiro.
+-- É uma coluna gerada: o banco recalcula em todo INSERT/UPDATE e já preenche
+-- as linhas existentes. A aplicação calcula o mesmo md5 para as linhas do CSV
+-- (database_api.hash_conteudo_produtos), então a fórmula precisa ficar igual nos dois lados.
+
+alter table produtos
+    add column if not exists hash_conteudo text
+    generated always as (
+        md5(
+            coalesce(descricao, '') || '|' ||
+            coalesce(emb, '') || '|' ||
+            coalesce(secao, '') || '|' ||
+            coalesce(grupo, '')
+        )
+    ) stored;
@@ -0,0 +1,15 @@
+-- Apoio ao relatório de contagens paginado no servidor
+-- (database_api.get_relatorio_contagens_pagina).
+--
+-- Os filtros de seção e grupo viram um join produtos!inner com
+-- produtos.secao = ... / produtos.grupo = ..., e a lista de usuários do filtro
+-- sai de uma view pequena em vez de varrer as contagens no navegador.
+
+create index if not exists produtos_secao_idx on produtos (secao);
+create index if not exists produtos_grupo_idx on produtos (grupo);
+-- A ordenação da janela é por id; o filtro por usuário já usa a
+-- restrição única (usuario_uid, ean) do sql/002.
+
+create or replace view distinct_usuarios_contagem as
+select distinct usuario_uid
+from contagens;
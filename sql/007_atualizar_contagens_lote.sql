@@ -0,0 +1,25 @@
+-- Edição de várias quantidades numa única chamada e numa única transação
+-- (botão "💾 Salvar Alterações" do relatório; database_api.update_counts_bulk).
+-- Ou todas as linhas mudam, ou nenhuma.
+--
+-- p_itens: [{"id": 10, "quantidade": 3}, {"id": 11, "quantidade": 0.5}, ...]
+--
+--   select atualizar_contagens_lote('[{"id": 10, "quantidade": 3}]'::jsonb);
+
+create or replace function atualizar_contagens_lote(p_itens jsonb)
+returns integer
+language sql
+as $$
+    with itens as (
+        select (i ->> 'id')::bigint as id,
+               (i ->> 'quantidade')::numeric as quantidade
+        from jsonb_array_elements(p_itens) as i
+    ), alterados as (
+        update contagens c
+        set quantidade = itens.quantidade
+        from itens
+        where c.id = itens.id
+        returning 1
+    )
+    select count(*)::integer from alterados;
+$$;
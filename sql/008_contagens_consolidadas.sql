@@ -0,0 +1,104 @@
+-- Total contado por EAN mantido pelo próprio banco, para a auditoria ler uma
+-- linha por produto em vez de todas as contagens
+-- (database_api.get_contagens_consolidadas).
+--
+-- Os triggers são por comando (FOR EACH STATEMENT) com tabelas de transição:
+-- um lote de 500 incrementos vira um único upsert somado por EAN. O upsert
+-- trava a linha do EAN, então escritas concorrentes se somam sem perder nada;
+-- a ordem por EAN evita deadlock entre dois lotes que tocam os mesmos produtos.
+--
+--   select * from contagens_consolidadas where ean = '7891234567895';
+
+create table if not exists contagens_consolidadas (
+    ean text primary key,
+    quantidade numeric not null default 0,
+    linhas integer not null default 0,   -- quantas linhas de contagens somam neste EAN
+    atualizado_em timestamptz not null default now()
+);
+
+create or replace function aplicar_delta_consolidado()
+returns trigger
+language plpgsql
+as $$
+begin
+    if tg_op = 'INSERT' then
+        insert into contagens_consolidadas (ean, quantidade, linhas)
+        select ean, sum(quantidade), count(*) from novas group by ean order by ean
+        on conflict (ean) do update
+            set quantidade = contagens_consolidadas.quantidade + excluded.quantidade,
+                linhas = contagens_consolidadas.linhas + excluded.linhas,
+                atualizado_em = now();
+    elsif tg_op = 'DELETE' then
+        insert into contagens_consolidadas (ean, quantidade, linhas)
+        select ean, -sum(quantidade), -count(*) from antigas group by ean order by ean
+        on conflict (ean) do update
+            set quantidade = contagens_consolidadas.quantidade + excluded.quantidade,
+                linhas = contagens_consolidadas.linhas + excluded.linhas,
+                atualizado_em = now();
+        delete from contagens_consolidadas c
+        using (select distinct ean from antigas) a
+        where c.ean = a.ean and c.linhas <= 0;
+    else
+        -- UPDATE: o EAN pode ter mudado, então entra o novo e sai o antigo
+        insert into contagens_consolidadas (ean, quantidade, linhas)
+        select ean, sum(quantidade), sum(linhas)
+        from (
+            select ean, quantidade, 1 as linhas from novas
+            union all
+            select ean, -quantidade, -1 from antigas
+        ) delta
+        group by ean
+        order by ean
+        on conflict (ean) do update
+            set quantidade = contagens_consolidadas.quantidade + excluded.quantidade,
+                linhas = contagens_consolidadas.linhas + excluded.linhas,
+                atualizado_em = now();
+        delete from contagens_consolidadas c
+        using (select distinct ean from antigas) a
+        where c.ean = a.ean and c.linhas <= 0;
+    end if;
+    return null;
+end;
+$$;
+
+create or replace function limpar_contagens_consolidadas()
+returns trigger
+language plpgsql
+as $$
+begin
+    delete from contagens_consolidadas;
+    return null;
+end;
+$$;
+
+drop trigger if exists contagens_consolidar_insert on contagens;
+drop trigger if exists contagens_consolidar_update on contagens;
+drop trigger if exists contagens_consolidar_delete on contagens;
+drop trigger if exists contagens_consolidar_truncate on contagens;
+
+create trigger contagens_consolidar_insert
+    after insert on contagens
+    referencing new table as novas
+    for each statement execute function aplicar_delta_consolidado();
+
+create trigger contagens_consolidar_update
+    after update on contagens
+    referencing old table as antigas new table as novas
+    for each statement execute function aplicar_delta_consolidado();
+
+create trigger contagens_consolidar_delete
+    after delete on contagens
+    referencing old table as antigas
+    for each statement execute function aplicar_delta_consolidado();
+
+create trigger contagens_consolidar_truncate
+    after truncate on contagens
+    for each statement execute function limpar_contagens_consolidadas();
+
+-- Carga inicial; o lock impede que uma contagem entre entre a soma e os triggers
+begin;
+lock table contagens in share row exclusive mode;
+delete from contagens_consolidadas;
+insert into contagens_consolidadas (ean, quantidade, linhas)
+select ean, sum(quantidade), count(*) from contagens group by ean;
+commit;
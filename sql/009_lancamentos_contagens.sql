@@ -0,0 +1,52 @@
+-- Envio idempotente da fila write-behind (modules/fila_contagens.py).
+-- Cada item da fila leva um id estável ("<envio>:<usuario_uid>:<ean>"); o banco
+-- guarda os ids já aplicados e ignora um reenvio do mesmo item (resposta
+-- perdida, processo morto antes de limpar o diário), então nada conta em
+-- dobro. Itens sem id são somados sempre, como em incrementar_contagens_lote
+-- (sql/003). Depende da restrição única de sql/002.
+--
+--   select aplicar_lancamentos_contagens('[
+--     {"id": "a1b2:00000000-0000-0000-0000-000000000001:7891234567895",
+--      "usuario_uid": "00000000-0000-0000-0000-000000000001", "ean": "7891234567895", "quantidade": 2}
+--   ]'::jsonb);
+--   -- a segunda chamada com o mesmo id não soma nada
+--
+-- Os ids só precisam durar enquanto um reenvio for possível; para limpar:
+--   delete from contagens_lancamentos where aplicado_em < now() - interval '30 days';
+
+create table if not exists contagens_lancamentos (
+    id text primary key,
+    aplicado_em timestamptz not null default now()
+);
+
+create or replace function aplicar_lancamentos_contagens(p_itens jsonb)
+returns integer
+language sql
+as $$
+    with itens as (
+        select i ->> 'id' as id,
+               (i ->> 'usuario_uid')::uuid as usuario_uid,
+               i ->> 'ean' as ean,
+               (i ->> 'quantidade')::numeric as quantidade
+        from jsonb_array_elements(p_itens) as i
+    ), novos as (
+        -- Um reenvio concorrente do mesmo id espera este commit e não insere nada
+        insert into contagens_lancamentos (id)
+        select distinct id from itens where id is not null
+        on conflict (id) do nothing
+        returning id
+    ), a_aplicar as (
+        select usuario_uid, ean, sum(quantidade) as quantidade
+        from itens
+        where id is null or id in (select id from novos)
+        group by 1, 2
+    ), gravados as (
+        insert into contagens (usuario_uid, ean, quantidade)
+        select usuario_uid, ean, quantidade from a_aplicar
+        on conflict (usuario_uid, ean) do update
+            set quantidade = contagens.quantidade + excluded.quantidade,
+                last_updated_at = now()
+        returning 1
+    )
+    select count(*)::integer from gravados;
+$$;
@@ -0,0 +1,54 @@
+import httpx
+import pytest
+from postgrest.exceptions import APIError
+
+from modules.erros_banco import erro_de_dados
+from modules.fila_contagens import FilaContagens
+
+
+def _erro(codigo, mensagem="erro"):
+    return APIError({"code": codigo, "message": mensagem, "details": None, "hint": None})
+
+
+def _fila(tmp_path, enviar):
+    # erro_transitorio como em database_api.fila_contagens
+    return FilaContagens(str(tmp_path / "fila.db"), enviar, intervalo=3600,
+                         erro_transitorio=lambda erro: not erro_de_dados(erro))
+
+
+@pytest.mark.parametrize("erro", [
+    _erro(None, "503 Service Unavailable"),
+    _erro("57014", "canceling statement due to statement timeout"),
+    _erro("PGRST301", "JWT expired"),
+    _erro("40P01", "deadlock detected"),
+    RuntimeError("503 Service Unavailable"),
+    httpx.ConnectError("sem rede"),
+])
+def test_erro_transitorio_fica_no_diario(tmp_path, erro):
+    def enviar(itens):
+        raise erro
+
+    fila = _fila(tmp_path, enviar)
+    fila.adicionar("u", "7891000315507", 2)
+    with pytest.raises(type(erro)):
+        fila.flush()
+    assert fila.pendentes() == 1
+    assert fila.rejeitados() == []
+
+
+def test_erro_de_dados_isola_so_o_item_ruim(tmp_path):
+    gravados = []
+
+    def enviar(itens):
+        if any(item["ean"] == "0000000000000" for item in itens):
+            raise _erro("23503", "violates foreign key constraint")
+        gravados.extend(itens)
+        return itens
+
+    fila = _fila(tmp_path, enviar)
+    for ean in ("7891000315507", "0000000000000", "7891000100103"):
+        fila.adicionar("u", ean, 1)
+    assert fila.flush() == 3
+    assert fila.pendentes() == 0
+    assert sorted(item["ean"] for item in gravados) == ["7891000100103", "7891000315507"]
+    assert [r["ean"] for r in fila.rejeitados()] == ["0000000000000"]